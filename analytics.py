@@ -0,0 +1,141 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+import models
+
+PERIODS = ("day", "week")
+
+# Sale ids looked up per query, well under the bound parameter limits of SQLite and Postgres
+ROLLUP_CHUNK_SIZE = 10000
+
+
+def bucket_start(period: str, moment: datetime) -> date:
+    """First day of the day or ISO week (Monday) containing `moment`"""
+    day = moment.date()
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def rollup_rows(db: Session):
+    return (
+        db.query(models.Sale.created_at, models.Sale.total, models.Order.item_id, models.Order.status)
+        .join(models.Order, models.Sale.order_id == models.Order.id)
+    )
+
+
+def rollup_deltas(rows, sign: int = 1) -> dict:
+    """Count and total per (period, bucket, item_id, status) of (created_at, total, item_id, status) rows"""
+    deltas = defaultdict(lambda: [0, 0.0])
+    for created_at, total, item_id, status in rows:
+        for period in PERIODS:
+            delta = deltas[(period, bucket_start(period, created_at), item_id, status)]
+            delta[0] += sign
+            delta[1] += sign * total
+    return deltas
+
+
+def rollup_sales(db: Session, sale_ids: list, sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) sales from the rollup table.
+
+    Reads only the given sales, so the cost is proportional to the write, not the
+    table. Call after the sales are flushed and before committing.
+    """
+    if not sale_ids:
+        return
+    query = rollup_rows(db)
+    rows = (row for start in range(0, len(sale_ids), ROLLUP_CHUNK_SIZE)
+            for row in query.filter(models.Sale.id.in_(sale_ids[start:start + ROLLUP_CHUNK_SIZE])))
+    deltas = rollup_deltas(rows, sign)
+
+    Rollup = models.SalesRollup
+    for (period, bucket, item_id, status), (count, total) in deltas.items():
+        updated = db.query(Rollup).filter(
+            Rollup.period == period, Rollup.bucket == bucket,
+            Rollup.item_id == item_id, Rollup.status == status,
+        ).update({Rollup.count: Rollup.count + count, Rollup.total: Rollup.total + total})
+        if not updated:
+            db.add(Rollup(period=period, bucket=bucket, item_id=item_id, status=status, count=count, total=total))
+
+
+def rebuild_rollups(db: Session):
+    """Recompute the whole rollup table from the sales table.
+
+    For sales written before the rollups existed, or to repair drift. Streams the
+    sales in chunks; call before committing.
+    """
+    db.query(models.SalesRollup).delete(synchronize_session=False)
+    rows = rollup_rows(db).execution_options(yield_per=ROLLUP_CHUNK_SIZE)
+    db.add_all(
+        models.SalesRollup(period=period, bucket=bucket, item_id=item_id, status=status, count=count, total=total)
+        for (period, bucket, item_id, status), (count, total) in rollup_deltas(rows).items()
+    )
+
+
+def summary_row(key: dict, count: int, total: float) -> dict:
+    total = total or 0.0
+    return dict(key, count=count, total=total, average=total / count if count else 0.0)
+
+
+def rollup_summary(db: Session, period: Optional[str], since: Optional[date], until: Optional[date]) -> dict:
+    """Totals by item, by order status and optionally by period, read from the rollup table.
+
+    Without a period the week rows are summed, the coarsest rollup available,
+    unless since or until is given: weeks are bucketed on their Monday, so a
+    range is summed over the day rows to cut at the exact days. With
+    period="week" the range selects weeks by their Monday.
+    """
+    Rollup = models.SalesRollup
+    rows_period = period or ("week" if since is None and until is None else "day")
+    filters = [Rollup.period == rows_period, Rollup.count != 0]
+    if since is not None:
+        filters.append(Rollup.bucket >= since)
+    if until is not None:
+        filters.append(Rollup.bucket <= until)
+    count, total = func.sum(Rollup.count), func.sum(Rollup.total)
+
+    by_item = (
+        db.query(Rollup.item_id, models.Item.name, count, total)
+        .outerjoin(models.Item, Rollup.item_id == models.Item.id)
+        .filter(*filters).group_by(Rollup.item_id, models.Item.name).order_by(Rollup.item_id)
+    )
+    by_status = db.query(Rollup.status, count, total).filter(*filters).group_by(Rollup.status).order_by(Rollup.status)
+    summary = {
+        "by_item": [summary_row({"item_id": i, "name": n}, c, t) for i, n, c, t in by_item],
+        "by_status": [summary_row({"status": s}, c, t) for s, c, t in by_status],
+        "buckets": [],
+    }
+    if period:
+        buckets = db.query(Rollup.bucket, count, total).filter(*filters).group_by(Rollup.bucket).order_by(Rollup.bucket)
+        summary["buckets"] = [summary_row({"bucket": b}, c, t) for b, c, t in buckets]
+    return summary
+
+
+def live_summary(db: Session, since: Optional[date], until: Optional[date]) -> dict:
+    """The same totals aggregated directly over sales joined through Sale.order -> Order.item.
+
+    Scans every matching sale; used to check or rebuild the rollups.
+    """
+    filters = []
+    if since is not None:
+        filters.append(models.Sale.created_at >= datetime.combine(since, datetime.min.time()))
+    if until is not None:
+        filters.append(models.Sale.created_at < datetime.combine(until + timedelta(days=1), datetime.min.time()))
+    count, total = func.count(models.Sale.id), func.sum(models.Sale.total)
+    joined = lambda *columns: db.query(*columns).join(models.Order, models.Sale.order_id == models.Order.id).filter(*filters)
+
+    by_item = (
+        joined(models.Order.item_id, models.Item.name, count, total)
+        .outerjoin(models.Item, models.Order.item_id == models.Item.id)
+        .group_by(models.Order.item_id, models.Item.name).order_by(models.Order.item_id)
+    )
+    by_status = joined(models.Order.status, count, total).group_by(models.Order.status).order_by(models.Order.status)
+    return {
+        "by_item": [summary_row({"item_id": i, "name": n}, c, t) for i, n, c, t in by_item],
+        "by_status": [summary_row({"status": s}, c, t) for s, c, t in by_status],
+        "buckets": [],
+    }
@@ -0,0 +1,54 @@
+"""Requests/sec and p99 latency of GET /items at high concurrency, sync vs async database mode.
+
+The load generator runs on the same machine, so use a box with spare cores
+for meaningful absolute numbers.
+"""
+import asyncio
+import tempfile
+import time
+
+import httpx
+import requests
+
+from benchmarks.common import percentile, uvicorn_server
+
+REQUESTS = 3000
+CONCURRENCY = 200
+
+
+async def load(base_url):
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=CONCURRENCY)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        remaining = iter(range(REQUESTS))
+
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                start = time.perf_counter()
+                try:
+                    response = await client.get('/items', params={'limit': 20})
+                    response.raise_for_status()
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+        elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, percentile(latencies, 99) * 1000, errors
+
+
+def main():
+    for label, scheme in (('sync', 'sqlite'), ('async', 'sqlite+aiosqlite')):
+        with tempfile.TemporaryDirectory() as tmp:
+            with uvicorn_server(database_url=f'{scheme}:///{tmp}/bench.db') as base_url:
+                requests.post(base_url + '/items/bulk', json=[{'name': f'item {i}', 'price': i} for i in range(100)])
+                rps, p99, errors = asyncio.run(load(base_url))
+                print(f'{label:<6} {rps:8.0f} req/sec   p99 {p99:7.1f} ms   {errors} errors')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Concurrent checkouts through the Django checkout view on SQLite.
+
+Many buyers race for a few units of one product, each checking out through
+the test client from its own thread. Reports orders/sec and confirms nothing
+was oversold or answered with an error. Builds a throwaway SQLite database,
+so it does not touch db.sqlite3.
+"""
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.common import setup_django
+
+BUYERS = 200
+STOCK = 50
+THREADS = 16
+
+
+def main():
+    setup_django()
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from django.urls import reverse
+
+    setup_test_environment()
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.DATABASES['default']['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+        call_command('migrate', verbosity=0)
+        from shop.models import Category, Order, Product
+
+        product = Product.objects.create(
+            category=Category.objects.create(name='Bench'), title='Last Copies', price=10, inventory=STOCK
+        )
+        url = reverse('shop:checkout')
+        form = {
+            'name': 'Juan', 'email': 'juan@example.com', 'address1': '1 Street',
+            'city': 'Manila', 'postal_code': '1000', 'country': 'Philippines',
+        }
+        clients = []
+        for _ in range(BUYERS):
+            client = Client()
+            session = client.session
+            session['cart'] = {str(product.id): {'quantity': 1, 'price': '10', 'title': product.title}}
+            session.save()
+            client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+            clients.append(client)
+        connection.close()
+
+        statuses = []
+        lock = threading.Lock()
+
+        def buyer(assigned):
+            try:
+                for client in assigned:
+                    try:
+                        status = client.post(url, form).status_code
+                    except Exception as e:
+                        status = type(e).__name__
+                    with lock:
+                        statuses.append(status)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer, args=(clients[i::THREADS],)) for i in range(THREADS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        product.refresh_from_db()
+        errors = [status for status in statuses if status != 302]
+        print(f'{BUYERS} checkouts from {THREADS} threads in {elapsed:.2f}s: {BUYERS / elapsed:.0f} checkouts/sec')
+        print(f'orders: {Order.objects.count()} (stock {STOCK}), inventory left: {product.inventory}, errors: {len(errors)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Calls/sec of FastAPIClient against a local uvicorn: one connection per call vs the pooled session."""
+import time
+
+import requests
+
+from benchmarks.common import setup_django, uvicorn_server
+
+CALLS = 2000
+
+
+def run(label, call):
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        call()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<28} {CALLS / elapsed:8.0f} calls/sec')
+
+
+def main():
+    setup_django()
+    from django.conf import settings
+    from shop.fastapi_client import FastAPIClient
+
+    with uvicorn_server() as base_url:
+        settings.FASTAPI_BASE_URL = base_url
+        client = FastAPIClient()
+        run('requests.get per call', lambda: requests.get(base_url + '/items', timeout=30).json())
+        run('pooled FastAPIClient', lambda: client._make_request('GET', '/items'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Helpers shared by the benchmark scripts.
+
+Run the benchmarks from the repository root, e.g.
+    python -m benchmarks.client_pool
+"""
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def uvicorn_server(database_url=None, workers=1, env=None):
+    """Run main:app under uvicorn on a throwaway SQLite file and yield its base URL"""
+    with tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        server_env = dict(os.environ, **(env or {}))
+        server_env['DATABASE_URL'] = database_url or f'sqlite:///{tmp}/bench.db'
+        # Create the tables once so several workers don't race on create_all
+        subprocess.run([sys.executable, '-c', 'import main'], cwd=ROOT, env=server_env, check=True)
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port),
+             '--workers', str(workers), '--log-level', 'warning'],
+            cwd=ROOT, env=server_env,
+        )
+        base_url = f'http://127.0.0.1:{port}'
+        try:
+            for _ in range(100):
+                try:
+                    requests.get(base_url + '/', timeout=1)
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+            yield base_url
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')
+    sys.path.insert(0, ROOT)
+    import django
+    django.setup()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
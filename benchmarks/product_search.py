@@ -0,0 +1,80 @@
+"""Search latency over a synthetic 200k-product catalog: title__icontains vs the FTS5 index.
+
+Builds a throwaway SQLite database, so it does not touch db.sqlite3.
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from benchmarks.common import percentile, setup_django
+
+PRODUCTS = 200_000
+BATCH = 5000
+REPEAT = 10
+# Rare words, a two-word AND, no match, and a broad prefix that hits ~13k products
+QUERIES = ['wireless', 'pro', 'quantum lamp', 'zyx', 'kalo']
+
+
+def words(rng, vocabulary, count):
+    return ' '.join(rng.choice(vocabulary) for _ in range(count))
+
+
+def populate(Category, Product):
+    rng = random.Random(42)
+    syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'vo', 'zi', 'be', 'do']
+    vocabulary = [''.join(rng.choice(syllables) for _ in range(3)) for _ in range(5000)]
+    vocabulary += ['wireless', 'pro', 'carbon', 'keyboard', 'lamp', 'quantum', 'mouse', 'cable', 'monitor', 'desk']
+    category = Category.objects.create(name='Bench')
+    for start in range(0, PRODUCTS, BATCH):
+        Product.objects.bulk_create([
+            Product(
+                category=category, slug=f'bench-{i}', price=10, inventory=5,
+                title=words(rng, vocabulary, rng.randint(2, 5)).title(),
+                description=words(rng, vocabulary, rng.randint(10, 30)),
+            )
+            for i in range(start, min(start + BATCH, PRODUCTS))
+        ])
+
+
+def timed(fn):
+    samples = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), percentile(samples, 95)
+
+
+def main():
+    setup_django()
+    from django.conf import settings
+    from django.core.management import call_command
+
+    with tempfile.TemporaryDirectory() as tmp:
+        settings.DATABASES['default']['NAME'] = os.path.join(tmp, 'bench.sqlite3')
+        call_command('migrate', verbosity=0)
+        from shop.models import Category, Product
+        from shop.pagination import product_page
+        from shop.search import rebuild_index, search_page
+
+        start = time.perf_counter()
+        populate(Category, Product)
+        print(f'created {PRODUCTS} products in {time.perf_counter() - start:.1f}s')
+        start = time.perf_counter()
+        rebuild_index()
+        print(f'rebuilt the search index in {time.perf_counter() - start:.1f}s\n')
+
+        active = Product.objects.filter(is_active=True)
+        print(f'{"query":<16} {"icontains, all rows":>22} {"icontains, 1st page":>22} {"fts5, 1st page":>22}')
+        for query in QUERIES:
+            every = timed(lambda: list(active.filter(title__icontains=query)))
+            first = timed(lambda: product_page(active.filter(title__icontains=query)))
+            fts = timed(lambda: search_page(active, query))
+            print(f'{query:<16}' + ''.join(f'{median:>10.1f} / {p95:>6.1f} ms' for median, p95 in (every, first, fts)))
+        print('\n(median / p95 over', REPEAT, 'runs)')
+
+
+if __name__ == '__main__':
+    main()
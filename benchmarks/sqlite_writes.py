@@ -0,0 +1,42 @@
+"""Concurrent write throughput against SQLite with and without the connection tuning profile.
+
+Runs main:app with two uvicorn workers so writers in separate processes
+contend for the database file, then issues POST /orders from many threads.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.common import uvicorn_server
+
+WRITES = 2000
+CONCURRENCY = 32
+
+
+def run(base_url):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=CONCURRENCY)
+    session.mount('http://', adapter)
+    item_id = session.post(base_url + '/items', json={'name': 'bench item', 'price': 1.0}).json()['id']
+
+    def write(_):
+        response = session.post(base_url + '/orders', json={'item_id': item_id, 'quantity': 1})
+        return response.status_code == 200
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        results = list(executor.map(write, range(WRITES)))
+    elapsed = time.perf_counter() - start
+    return results.count(True) / elapsed, results.count(False)
+
+
+def main():
+    for label, tuning in (('defaults', '0'), ('tuned', '1')):
+        with uvicorn_server(workers=2, env={'SQLITE_TUNING': tuning}) as base_url:
+            writes_per_sec, errors = run(base_url)
+            print(f'{label:<9} {writes_per_sec:8.0f} writes/sec   {errors} failed writes')
+
+
+if __name__ == '__main__':
+    main()
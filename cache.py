@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+import models
+
+# How long a cached item page or item stays valid without any write
+ITEM_CACHE_TTL_SECONDS = float(os.getenv("ITEM_CACHE_TTL_SECONDS", "60"))
+
+
+def read_generation(db: Session, name: str) -> int:
+    """Current write generation of a table, shared by every worker using the database"""
+    generation = db.query(models.CacheGeneration.generation).filter(models.CacheGeneration.name == name).scalar()
+    return generation or 0
+
+
+def bump_generation(db: Session, name: str):
+    """Mark cached reads of a table stale; call before committing a write to it"""
+    updated = db.query(models.CacheGeneration).filter(models.CacheGeneration.name == name).update(
+        {models.CacheGeneration.generation: models.CacheGeneration.generation + 1}
+    )
+    if not updated:
+        db.add(models.CacheGeneration(name=name, generation=1))
+
+
+class ResponseCache:
+    """In-process cache of serialized responses, keyed by anything hashable.
+
+    Entries expire after `ttl` seconds and are all dropped when the table's
+    generation counter moves. Writes invalidate it by calling bump_generation, which
+    reaches every worker, so there is no per-process invalidate.
+
+    Callers pass the generation their read saw. A request that read an older
+    generation than another one already synced neither gets nor stores entries,
+    so a slow build can't cache a body that predates the newer write.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _sync_generation(self, generation: int) -> bool:
+        """Move forward to a newer `generation`, never back; False if the caller's is stale. Hold the lock."""
+        if self.generation is None or generation > self.generation:
+            self._entries.clear()
+            self.generation = generation
+        return generation == self.generation
+
+    def get(self, key, generation: int):
+        with self._lock:
+            entry = self._entries.get(key) if self._sync_generation(generation) else None
+            if entry and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, generation: int):
+        with self._lock:
+            if self._sync_generation(generation):
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "generation": self.generation}
+
+
+item_cache = ResponseCache(ITEM_CACHE_TTL_SECONDS)
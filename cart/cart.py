@@ -1,5 +1,6 @@
 from decimal import Decimal
 from shop.models import Product
+from shop.inventory import hold_key_for, place_hold, release_holds
 
 CART_SESSION_ID = 'cart'
 
@@ -12,25 +13,32 @@ class Cart:
         self.cart = cart
 
     def add(self, product, quantity=1, update_quantity=False):
+        """Add to the cart and hold the units; raises InsufficientInventory, leaving the cart as it was"""
         product_id = str(product.id)
+        current = self.cart[product_id]['quantity'] if product_id in self.cart else 0
+        new_quantity = quantity if update_quantity else current + quantity
+        place_hold(product, self.hold_key, new_quantity)
         if product_id not in self.cart:
             self.cart[product_id] = {
                 'price': str(product.price),
                 'quantity': 0,
             }
-        if update_quantity:
-            self.cart[product_id]['quantity'] = quantity
-        else:
-            self.cart[product_id]['quantity'] += quantity
+        self.cart[product_id]['quantity'] = new_quantity
         self.save()
 
+    @property
+    def hold_key(self):
+        return hold_key_for(self.session)
+
     def remove(self, product_id):
         pid = str(product_id)
         if pid in self.cart:
             del self.cart[pid]
+            release_holds(self.hold_key, [product_id])
             self.save()
 
     def clear(self):
+        release_holds(self.hold_key)
         self.session[CART_SESSION_ID] = {}
         self.save()
 
@@ -38,7 +46,8 @@ class Cart:
         product_ids = self.cart.keys()
         products = Product.objects.filter(id__in=product_ids)
         for product in products:
-            item = self.cart[str(product.id)]
+            # A copy, so the Product and Decimals never end up in the session
+            item = dict(self.cart[str(product.id)])
             item['product'] = product
             item['price'] = Decimal(item['price'])
             item['total_price'] = item['price'] * item['quantity']
@@ -1,4 +1,8 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 from django.utils.text import slugify
 
@@ -48,6 +52,23 @@ class Product(TimeStampedModel):
     def __str__(self):
         return self.title
 
+class OrderQuerySet(models.QuerySet):
+    def line_total(self):
+        """SQL expression for the sum of an order's lines, correlated on the outer order"""
+        money = DecimalField(max_digits=12, decimal_places=2)
+        lines = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+        total = lines.annotate(total=Sum(F('price') * F('quantity'), output_field=money)).values('total')
+        return Coalesce(Subquery(total), Value(Decimal('0')), output_field=money)
+
+    def with_line_total(self):
+        """Annotate `line_total` computed from the lines, e.g. to audit the stored totals"""
+        return self.annotate(line_total=self.line_total())
+
+    def recalculate_totals(self):
+        """Store each order's total from its lines in one UPDATE"""
+        return self.update(total=self.line_total())
+
+
 class Order(TimeStampedModel):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='cart_orders')
     guest_email = models.EmailField(blank=True, null=True)
@@ -66,13 +87,17 @@ class Order(TimeStampedModel):
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
     ])
+    # Sum of the order lines, kept current when lines are written
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    objects = OrderQuerySet.as_manager()
 
     def __str__(self):
         return f"Order #{self.pk} - {self.created:%Y-%m-%d}"
 
     @property
     def total_amount(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.total
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -84,5 +109,20 @@ class OrderItem(models.Model):
     def total_price(self):
         return self.price * self.quantity
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.update_order_total()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.update_order_total()
+        return result
+
+    def update_order_total(self):
+        Order.objects.filter(pk=self.order_id).recalculate_totals()
+        # Keep an order instance the caller still holds in step with the database
+        if OrderItem.order.is_cached(self):
+            self.order.refresh_from_db(fields=['total'])
+
     def __str__(self):
         return f"{self.product} x {self.quantity}"
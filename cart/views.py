@@ -1,6 +1,8 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib import messages
 from django.http import JsonResponse
 from .cart import Cart
+from shop.inventory import InsufficientInventory
 from shop.models import Product
 
 
@@ -15,7 +17,10 @@ def cart_add(request):
         product_id = int(request.POST.get('product_id'))
         quantity = int(request.POST.get('quantity', 1))
         product = get_object_or_404(Product, id=product_id)
-        cart.add(product=product, quantity=quantity)
+        try:
+            cart.add(product=product, quantity=quantity)
+        except InsufficientInventory as e:
+            return JsonResponse({'qty': len(cart), 'error': str(e), 'available': e.available}, status=409)
         return JsonResponse({'qty': len(cart)})
 
 
@@ -29,7 +34,10 @@ def cart_update(request, product_id):
     cart = Cart(request)
     quantity = int(request.POST.get("quantity", 1))
     product = get_object_or_404(Product, id=product_id)
-    cart.add(product=product, quantity=quantity, update_quantity=True)
+    try:
+        cart.add(product=product, quantity=quantity, update_quantity=True)
+    except InsufficientInventory as e:
+        messages.error(request, str(e))
     return redirect("cart:cart_summary")
 
 
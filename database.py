@@ -1,6 +1,10 @@
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 import os
 from dotenv import load_dotenv
 
@@ -10,11 +14,60 @@ load_dotenv()
 # Get database URL from environment variables
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./shoplite.db")
 
-# Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+# An async driver in the URL (e.g. sqlite+aiosqlite://, postgresql+asyncpg://) selects async mode
+DATABASE_URL_INFO = make_url(DATABASE_URL)
+ASYNC_MODE = DATABASE_URL_INFO.get_dialect().is_async
+IS_SQLITE = DATABASE_URL_INFO.get_backend_name() == "sqlite"
+
+# SQLite tuning applied to every new connection; set SQLITE_TUNING=0 to use SQLite's defaults
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "1") == "1"
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negative values are KiB, so this is a 64 MiB page cache per connection
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-64000")),
+}
+
+
+def engine_options():
+    """Pool settings for create_engine, configurable through DB_POOL_* env vars"""
+    options = {
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") == "1",
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    }
+    # In-memory SQLite uses a single-connection pool that takes no sizing
+    if not (IS_SQLITE and DATABASE_URL_INFO.database in (None, "", ":memory:")):
+        options["pool_size"] = int(os.getenv("DB_POOL_SIZE", "10"))
+        options["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+        options["pool_timeout"] = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    return options
+
+
+if ASYNC_MODE:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(DATABASE_URL, **engine_options())
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    # Engine events and metadata operations go through the sync facade of the async engine
+    engine = async_engine.sync_engine
+    SessionLocal = None
+else:
+    # Create SQLAlchemy engine
+    engine = create_engine(DATABASE_URL, **engine_options())
 
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Create session factory
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+if IS_SQLITE and SQLITE_TUNING:
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
 
 # Base class for models
 Base = declarative_base()
@@ -26,3 +79,70 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+class Database:
+    """Runs synchronous ORM code from async route handlers.
+
+    In sync mode the function runs on the threadpool with a regular Session; in
+    async mode it runs on the event loop through AsyncSession.run_sync, so request
+    concurrency is not capped by the threadpool size.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    async def run(self, fn, *args, **kwargs):
+        if ASYNC_MODE:
+            return await self.session.run_sync(fn, *args, **kwargs)
+        return await run_in_threadpool(fn, self.session, *args, **kwargs)
+
+
+@asynccontextmanager
+async def session_scope():
+    if ASYNC_MODE:
+        async with AsyncSessionLocal() as session:
+            yield Database(session)
+    else:
+        db = SessionLocal()
+        try:
+            yield Database(db)
+        finally:
+            db.close()
+
+
+# Async dependency function for FastAPI routes, works in both modes
+async def get_async_db():
+    async with session_scope() as db:
+        yield db
+
+
+async def create_tables(setup=Base.metadata.create_all):
+    """Run `setup(connection)` in one transaction, by default creating the missing tables"""
+    if ASYNC_MODE:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(setup)
+    else:
+        with engine.begin() as conn:
+            setup(conn)
+
+
+async def stream_partitions(statement, size: int):
+    """Yield lists of up to `size` rows from a server-side cursor (yield_per).
+
+    The session stays open for as long as the caller keeps iterating, so only
+    one partition is held in memory at a time.
+    """
+    statement = statement.execution_options(yield_per=size)
+    if ASYNC_MODE:
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(statement)
+            async for partition in result.partitions():
+                yield partition
+    else:
+        def partitions():
+            with SessionLocal() as session:
+                yield from session.execute(statement).partitions()
+
+        async for partition in iterate_in_threadpool(partitions()):
+            yield partition
@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import tempfile
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -56,6 +57,17 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # BEGIN IMMEDIATE takes SQLite's write lock when a transaction starts, so a
+            # checkout that reads before it writes waits its turn for up to `timeout`
+            # seconds instead of failing with "database is locked" at its first write
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # On disk rather than the default shared-cache in-memory database, whose table locks
+        # fail at once instead of waiting, so concurrency tests see production locking.
+        # Kept in the temp directory so test runs leave nothing in the checkout.
+        'TEST': {'NAME': Path(tempfile.gettempdir()) / 'ecommerce_test_db.sqlite3'},
     }
 }
 
@@ -82,6 +94,21 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # FastAPI Integration
 FASTAPI_BASE_URL = 'http://localhost:8001'
+FASTAPI_POOL_SIZE = 10
+FASTAPI_CONNECT_TIMEOUT = 3.05
+FASTAPI_READ_TIMEOUT = 10
+FASTAPI_MAX_RETRIES = 3
+FASTAPI_BACKOFF_FACTOR = 0.2
+FASTAPI_BACKOFF_JITTER = 0.1
+FASTAPI_BREAKER_FAILURE_THRESHOLD = 5
+FASTAPI_BREAKER_COOLDOWN = 30.0
+FASTAPI_ETAG_CACHE_SIZE = 128
+
+# How long adding to the cart holds the units for that cart
+CART_HOLD_TTL_SECONDS = 900
+
+# Product cards per page on the home page and product list
+PRODUCTS_PER_PAGE = 24
 
 LOGIN_REDIRECT_URL = 'shop:product_list'
 LOGOUT_REDIRECT_URL = 'shop:product_list'
@@ -0,0 +1,112 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import session_scope
+import models
+
+# How long a stored response is replayed for a repeated Idempotency-Key
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+
+# How long a key stays reserved by a request that hasn't finished. After that the
+# worker is presumed dead and a retry may claim the key again.
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "60"))
+
+
+def claim_key(db: Session, key: str, path: str, request_hash: str):
+    """Reserve a key for this request, or return the response to send instead"""
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    record = db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).first()
+    if record and record.created_at < cutoff:
+        db.delete(record)
+        db.commit()
+        record = None
+
+    if record is None:
+        db.add(models.IdempotencyKey(key=key, path=path, request_hash=request_hash))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return JSONResponse(status_code=409, content={"detail": "A request with this Idempotency-Key is in progress"})
+        # Expired keys are dropped through the created_at index
+        db.query(models.IdempotencyKey).filter(models.IdempotencyKey.created_at < cutoff).delete()
+        db.commit()
+        return None
+
+    if record.path != path:
+        return JSONResponse(status_code=422, content={"detail": "Idempotency-Key was already used for another endpoint"})
+    if record.request_hash is not None and record.request_hash != request_hash:
+        return JSONResponse(status_code=422, content={"detail": "Idempotency-Key was already used with a different request body"})
+    if record.status_code is None:
+        # Take over the key once its lease has run out; the conditional UPDATE lets one retry win
+        lease_cutoff = now - timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)
+        reclaimed = db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.key == key,
+            models.IdempotencyKey.status_code.is_(None),
+            models.IdempotencyKey.created_at < lease_cutoff,
+        ).update({"created_at": now, "request_hash": request_hash}, synchronize_session=False)
+        db.commit()
+        if reclaimed:
+            return None
+        return JSONResponse(status_code=409, content={"detail": "A request with this Idempotency-Key is in progress"})
+    return Response(
+        content=record.response,
+        status_code=record.status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+def store_response(db: Session, key: str, status_code: int, body: bytes):
+    db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).update(
+        {"status_code": status_code, "response": body.decode()}
+    )
+    db.commit()
+
+
+def release_key(db: Session, key: str):
+    """Forget a key whose request failed so the client can retry it"""
+    db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).delete()
+    db.commit()
+
+
+async def idempotency_middleware(request: Request, call_next):
+    """Replay the stored response for POST requests that repeat an Idempotency-Key"""
+    key = request.headers.get("Idempotency-Key")
+    if request.method != "POST" or not key:
+        return await call_next(request)
+
+    # Starlette caches the body, so the route handler can still read it
+    request_hash = hashlib.sha256(await request.body()).hexdigest()
+    async with session_scope() as db:
+        replay = await db.run(claim_key, key, request.url.path, request_hash)
+    if replay is not None:
+        return replay
+
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+    except Exception:
+        async with session_scope() as db:
+            await db.run(release_key, key)
+        raise
+
+    async with session_scope() as db:
+        if 200 <= response.status_code < 300:
+            await db.run(store_response, key, response.status_code, body)
+        else:
+            await db.run(release_key, key)
+
+    return Response(
+        content=body,
+        status_code=response.status_code,
+        headers=dict(response.headers),
+        media_type=response.media_type,
+    )
@@ -1,118 +1,643 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base, get_db
+import base64
+import hashlib
+import json
+import os
+import zlib
+from datetime import date
+from typing import Optional
+
+from contextlib import asynccontextmanager
+
+try:
+    import orjson
+except ImportError:  # optional, only needed for FAST_SERIALIZATION
+    orjson = None
+
+from fastapi import FastAPI, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from sqlalchemy import and_, bindparam, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from database import ASYNC_MODE, Database, create_tables, engine, get_async_db, stream_partitions
 from schemas import OrderCreate, ItemUpdate
+from idempotency import idempotency_middleware
+from cache import bump_generation, item_cache, read_generation
+from analytics import live_summary, rollup_sales, rollup_summary
+from metrics import instrument_engine, metrics, timing_middleware
+from schema import upgrade_schema
 
 import models, schemas
 
-Base.metadata.create_all(bind=engine)
+if not ASYNC_MODE:
+    with engine.begin() as connection:
+        upgrade_schema(connection)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The async engine can only create tables from inside the event loop
+    if ASYNC_MODE:
+        await create_tables(upgrade_schema)
+    yield
+
+
+app = FastAPI(title="ShopLite API", lifespan=lifespan)
+
+# POST endpoints honor an Idempotency-Key header
+app.middleware("http")(idempotency_middleware)
+
+# Added last so it is outermost and times the idempotency lookups as well
+app.middleware("http")(timing_middleware)
+instrument_engine(engine)
+
+# Page size limits for the list endpoints
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# Serialize list pages from plain column rows with orjson instead of ORM objects and pydantic
+FAST_SERIALIZATION = os.getenv("FAST_SERIALIZATION", "1") == "1" and orjson is not None
+
+# Maximum number of rows accepted by the bulk insert endpoints
+MAX_BULK_SIZE = int(os.getenv("MAX_BULK_SIZE", "1000"))
+
+# Maximum number of rows touched by one bulk update or bulk delete request
+MAX_BULK_UPDATE_SIZE = int(os.getenv("MAX_BULK_UPDATE_SIZE", "50000"))
+
+# Rows fetched per round trip by the streaming export endpoints, and their gzip level
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+
+
+# PAGINATION
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(db: Session, model, limit: int, cursor: Optional[str], columns=None, filters=(), options=()):
+    """Keyset pagination on the primary key: WHERE id > :last ORDER BY id LIMIT :n
+
+    With `columns` the page holds plain rows of just those columns instead of ORM objects.
+    """
+    query = db.query(*columns) if columns else db.query(model).options(*options)
+    query = query.filter(*filters)
+    if cursor:
+        query = query.filter(model.id > decode_cursor(cursor))
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(model.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
+    return {"items": rows, "next_cursor": next_cursor}
+
+
+# CONDITIONAL RESPONSES
+def make_etag(table: str, generation: int, key) -> str:
+    """Strong ETag from the table's write generation and the request parameters"""
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return f'"{table}-{generation}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def conditional_body(db: Session, table: str, key, if_none_match: Optional[str], build, cache=None):
+    """Return (etag, body), with body None when the client's copy is current.
+
+    Only the generation row is read before answering a matching If-None-Match.
+    """
+    generation = read_generation(db, table)
+    etag = make_etag(table, generation, key)
+    if etag_matches(if_none_match, etag):
+        return etag, None
 
-app = FastAPI(title="ShopLite API")
+    body = None
+    if cache is not None:
+        body = cache.get(key, generation)
+    if body is None:
+        body = build()
+        if cache is not None:
+            cache.set(key, body, generation)
+    return etag, body
 
 
-def get_db():
-    db = SessionLocal()
+def json_response(etag: str, body: Optional[bytes]) -> Response:
+    if body is None:
+        return Response(status_code=304, headers={"ETag": etag})
+    # Bodies are already serialized, so skip response_model validation
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+def page_body(
+    db: Session, model, row_schema, page_schema, limit: int, cursor: Optional[str], filters=(), options=()
+) -> bytes:
+    # Loader options need ORM objects, so eager-loaded pages always take the pydantic path
+    if FAST_SERIALIZATION and not options:
+        # Select only the schema's columns and encode the rows directly, skipping ORM and pydantic
+        fields = list(row_schema.model_fields)
+        page = paginate(db, model, limit, cursor, columns=[getattr(model, field) for field in fields], filters=filters)
+        page["items"] = [dict(zip(fields, row)) for row in page["items"]]
+        return orjson.dumps(page)
+    page = paginate(db, model, limit, cursor, filters=filters, options=options)
+    return page_schema.model_validate(page).model_dump_json().encode()
+
+
+# BULK INSERT
+def bulk_insert(db: Session, model, rows: list, after_flush=None) -> list[int]:
+    """Insert all rows in one transaction and return their ids in input order
+
+    `after_flush(db, ids)` runs in the same transaction, before the commit.
+    """
+    if len(rows) > MAX_BULK_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_SIZE} rows per bulk request")
+    objects = [model(**row.dict()) for row in rows]
+    db.add_all(objects)
+    bump_generation(db, model.__tablename__)
     try:
-        yield db
-    finally:
-        db.close()
+        # flush batches the INSERTs (executemany / insertmanyvalues) and assigns ids
+        db.flush()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=str(e.orig))
+    ids = [obj.id for obj in objects]
+    if after_flush is not None:
+        after_flush(db, ids)
+    db.commit()
+    return ids
+
+
+# STREAMING EXPORTS
+def ndjson_lines(fields: list, rows) -> bytes:
+    if orjson is not None:
+        return b"".join(orjson.dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+    return "".join(json.dumps(dict(zip(fields, row)), separators=(",", ":")) + "\n" for row in rows).encode()
+
+
+async def ndjson_export(model, row_schema):
+    """Every row of the table as newline-delimited JSON, one yield_per batch at a time"""
+    fields = list(row_schema.model_fields)
+    statement = select(*[getattr(model, field) for field in fields]).order_by(model.id)
+    async for rows in stream_partitions(statement, EXPORT_BATCH_SIZE):
+        yield ndjson_lines(fields, rows)
+
+
+async def gzip_stream(chunks):
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31 writes a gzip header
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_response(model, row_schema, accept_encoding: Optional[str]) -> StreamingResponse:
+    chunks = ndjson_export(model, row_schema)
+    # Plain and gzipped bodies share the URL, so caches must key on Accept-Encoding
+    headers = {"Vary": "Accept-Encoding"}
+    if "gzip" in (accept_encoding or "").lower():
+        chunks = gzip_stream(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type="application/x-ndjson", headers=headers)
 
 
 # ITEMS
-@app.get("/items", response_model=list[schemas.ItemOut])
-def get_items(db: Session = Depends(get_db)):
-    return db.query(models.Item).all()
+@app.get("/items", response_model=schemas.ItemPage)
+async def get_items(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Database = Depends(get_async_db),
+):
+    def work(db: Session):
+        return conditional_body(
+            db, "items", ("page", limit, cursor), if_none_match,
+            lambda: page_body(db, models.Item, schemas.ItemOut, schemas.ItemPage, limit, cursor),
+            cache=item_cache,
+        )
+
+    return json_response(*await db.run(work))
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return {"items": item_cache.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse, summary="Request and database metrics in Prometheus text format")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.post("/items", response_model=schemas.ItemOut)
-def create_item(item: schemas.ItemCreate, db: Session = Depends(get_db)):
-    db_item = models.Item(name=item.name, price=item.price)
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+async def create_item(item: schemas.ItemCreate, db: Database = Depends(get_async_db)):
+    def work(db: Session):
+        db_item = models.Item(name=item.name, price=item.price)
+        db.add(db_item)
+        bump_generation(db, "items")
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise HTTPException(status_code=409, detail="Item with this name and price already exists")
+        db.refresh(db_item)
+        return db_item
+
+    return await db.run(work)
+
+
+@app.put("/items/by-key", response_model=schemas.ItemOut, summary="Get or create an Item by name and price")
+async def upsert_item_by_key(item: schemas.ItemCreate, db: Database = Depends(get_async_db)):
+    def work(db: Session):
+        query = db.query(models.Item).filter(models.Item.name == item.name, models.Item.price == item.price)
+        db_item = query.first()
+        if db_item:
+            return db_item
+
+        db_item = models.Item(name=item.name, price=item.price)
+        db.add(db_item)
+        bump_generation(db, "items")
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another request inserted the same key first
+            db.rollback()
+            return query.one()
+        db.refresh(db_item)
+        return db_item
+
+    return await db.run(work)
+
+
+@app.post("/items/bulk", response_model=schemas.BulkCreateOut)
+async def create_items(items: list[schemas.ItemCreate], db: Database = Depends(get_async_db)):
+    return {"ids": await db.run(bulk_insert, models.Item, items)}
 
 
 # ORDERS
 @app.post("/orders", response_model=schemas.OrderOut)
-def create_order(order: schemas.OrderCreate, db: Session = Depends(get_db)):
-    db_order = models.Order(item_id=order.item_id, quantity=order.quantity, status=order.status)
-    db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
-    return db_order
+async def create_order(order: schemas.OrderCreate, db: Database = Depends(get_async_db)):
+    def work(db: Session):
+        db_order = models.Order(item_id=order.item_id, quantity=order.quantity, status=order.status)
+        db.add(db_order)
+        bump_generation(db, "orders")
+        db.commit()
+        db.refresh(db_order)
+        return db_order
 
+    return await db.run(work)
 
-@app.get("/orders", response_model=list[schemas.OrderOut])
-def get_orders(db: Session = Depends(get_db)):
-    return db.query(models.Order).all()
+
+@app.post("/orders/bulk", response_model=schemas.BulkCreateOut)
+async def create_orders(orders: list[schemas.OrderCreate], db: Database = Depends(get_async_db)):
+    return {"ids": await db.run(bulk_insert, models.Order, orders)}
+
+
+def resolve_items(db: Session, lines: list) -> list[int]:
+    """Item id for each line: given ids are kept, the rest are found or created by (name, price)"""
+    keys = {(line.name, line.price) for line in lines if line.item_id is None}
+    found = {}
+    if keys:
+        existing = db.query(models.Item).filter(
+            or_(*(and_(models.Item.name == name, models.Item.price == price) for name, price in keys))
+        )
+        found = {(item.name, item.price): item.id for item in existing}
+        missing = [models.Item(name=name, price=price) for name, price in keys if (name, price) not in found]
+        if missing:
+            db.add_all(missing)
+            bump_generation(db, "items")
+            db.flush()
+            found.update({(item.name, item.price): item.id for item in missing})
+    return [line.item_id if line.item_id is not None else found[(line.name, line.price)] for line in lines]
+
+
+@app.post("/orders/composite", response_model=schemas.CompositeOrderOut, summary="Create items, orders and a sale in one call")
+async def create_composite_order(order: schemas.CompositeOrderCreate, db: Database = Depends(get_async_db)):
+    if len(order.lines) > MAX_BULK_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_SIZE} lines per order")
+
+    def work(db: Session):
+        # A concurrent request may create the same item between our lookup and insert; retry once
+        for attempt in range(2):
+            try:
+                item_ids = resolve_items(db, order.lines)
+                db_orders = [
+                    models.Order(item_id=item_id, quantity=line.quantity, status=order.status)
+                    for item_id, line in zip(item_ids, order.lines)
+                ]
+                db.add_all(db_orders)
+                bump_generation(db, "orders")
+                db.flush()
+                db_sale = None
+                if db_orders:
+                    db_sale = models.Sale(order_id=db_orders[0].id, total=order.total)
+                    db.add(db_sale)
+                    bump_generation(db, "sales")
+                    db.flush()
+                    rollup_sales(db, [db_sale.id])
+                result = {
+                    "item_ids": item_ids,
+                    "order_ids": [db_order.id for db_order in db_orders],
+                    "sale_id": db_sale.id if db_sale else None,
+                }
+                db.commit()
+                return result
+            except IntegrityError as e:
+                db.rollback()
+                if attempt:
+                    raise HTTPException(status_code=409, detail=str(e.orig))
+
+    return await db.run(work)
+
+
+def order_filters(status=None, item_id=None, min_id=None, max_id=None) -> list:
+    # Each filter is served by ix_orders_status_id / ix_orders_item_id_id or the primary key
+    filters = []
+    if status is not None:
+        filters.append(models.Order.status == status)
+    if item_id is not None:
+        filters.append(models.Order.item_id == item_id)
+    if min_id is not None:
+        filters.append(models.Order.id >= min_id)
+    if max_id is not None:
+        filters.append(models.Order.id <= max_id)
+    return filters
+
+
+@app.get("/orders", response_model=schemas.OrderPage)
+async def get_orders(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    item_id: Optional[int] = None,
+    min_id: Optional[int] = Query(None, description="Only orders with id >= min_id"),
+    max_id: Optional[int] = Query(None, description="Only orders with id <= max_id"),
+    expand: Optional[str] = Query(None, pattern="^item$", description="Embed each order's item"),
+    if_none_match: Optional[str] = Header(None),
+    db: Database = Depends(get_async_db),
+):
+    filters = order_filters(status, item_id, min_id, max_id)
+
+    def work(db: Session):
+        key = ("page", limit, cursor, status, item_id, min_id, max_id, expand)
+        if expand:
+            # Embedded items change without an orders write, so their generation is part of the key
+            key += (read_generation(db, "items"),)
+            build = lambda: page_body(
+                db, models.Order, schemas.OrderWithItemOut, schemas.OrderWithItemPage, limit, cursor,
+                filters=filters, options=[joinedload(models.Order.item)],
+            )
+        else:
+            build = lambda: page_body(
+                db, models.Order, schemas.OrderOut, schemas.OrderPage, limit, cursor, filters=filters,
+            )
+        return conditional_body(db, "orders", key, if_none_match, build)
+
+    return json_response(*await db.run(work))
+
+
+@app.get("/orders/export", summary="Stream every Order as newline-delimited JSON")
+async def export_orders(accept_encoding: Optional[str] = Header(None)):
+    return export_response(models.Order, schemas.OrderOut, accept_encoding)
 
 
 # SALES
-@app.get("/sales", response_model=list[schemas.SaleOut])
-def get_sales(db: Session = Depends(get_db)):
-    return db.query(models.Sale).all()
+@app.get("/sales", response_model=schemas.SalePage)
+async def get_sales(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Database = Depends(get_async_db),
+):
+    def work(db: Session):
+        return conditional_body(
+            db, "sales", ("page", limit, cursor), if_none_match,
+            lambda: page_body(db, models.Sale, schemas.SaleOut, schemas.SalePage, limit, cursor),
+        )
+
+    return json_response(*await db.run(work))
+
+@app.get("/sales/summary", response_model=schemas.SalesSummary)
+async def get_sales_summary(
+    period: Optional[str] = Query(None, pattern="^(day|week)$", description="Also group totals by day or week"),
+    since: Optional[date] = Query(None, description="First bucket to include"),
+    until: Optional[date] = Query(None, description="Last bucket to include"),
+    source: str = Query("rollup", pattern="^(rollup|live)$", description="live aggregates the sales table directly"),
+    if_none_match: Optional[str] = Header(None),
+    db: Database = Depends(get_async_db),
+):
+    """Sale counts, totals and averages by item and by order status"""
+    if source == "live" and period:
+        raise HTTPException(status_code=400, detail="Grouping by period requires the rollup source")
+
+    def work(db: Session):
+        def build():
+            if source == "live":
+                summary = live_summary(db, since, until)
+            else:
+                summary = rollup_summary(db, period, since, until)
+            return schemas.SalesSummary.model_validate(summary).model_dump_json().encode()
+
+        # Order status and item names feed the summary too
+        key = ("summary", period, since, until, source, read_generation(db, "orders"), read_generation(db, "items"))
+        return conditional_body(db, "sales", key, if_none_match, build)
+
+    return json_response(*await db.run(work))
+
+
+@app.get("/sales/export", summary="Stream every Sale as newline-delimited JSON")
+async def export_sales(accept_encoding: Optional[str] = Header(None)):
+    return export_response(models.Sale, schemas.SaleOut, accept_encoding)
+
 
 @app.post("/sales", response_model=schemas.SaleOut)
-def create_sale(sale: schemas.SaleBase, db: Session = Depends(get_db)):
-    db_sale = models.Sale(order_id=sale.order_id, total=sale.total)
-    db.add(db_sale)
-    db.commit()
-    db.refresh(db_sale)
-    return db_sale
+async def create_sale(sale: schemas.SaleBase, db: Database = Depends(get_async_db)):
+    def work(db: Session):
+        db_sale = models.Sale(order_id=sale.order_id, total=sale.total)
+        db.add(db_sale)
+        bump_generation(db, "sales")
+        db.flush()
+        rollup_sales(db, [db_sale.id])
+        db.commit()
+        db.refresh(db_sale)
+        return db_sale
+
+    return await db.run(work)
+
+@app.post("/sales/bulk", response_model=schemas.BulkCreateOut)
+async def create_sales(sales: list[schemas.SaleBase], db: Database = Depends(get_async_db)):
+    return {"ids": await db.run(bulk_insert, models.Sale, sales, rollup_sales)}
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to ShopLite API!"}
 
+@app.get("/items/{item_id}", response_model=schemas.ItemOut)
+async def get_item(item_id: int, if_none_match: Optional[str] = Header(None), db: Database = Depends(get_async_db)):
+    def work(db: Session):
+        def build():
+            item = db.query(models.Item).filter(models.Item.id == item_id).first()
+            if not item:
+                raise HTTPException(status_code=404, detail="Item not found")
+            return schemas.ItemOut.model_validate(item).model_dump_json().encode()
+
+        return conditional_body(db, "items", ("item", item_id), if_none_match, build, cache=item_cache)
+
+    return json_response(*await db.run(work))
+
+@app.patch("/items/bulk", response_model=schemas.BulkUpdateOut, summary="Update many Items in one transaction")
+async def update_items(items: list[schemas.ItemBulkUpdate], db: Database = Depends(get_async_db)):
+    if len(items) > MAX_BULK_UPDATE_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_UPDATE_SIZE} rows per bulk request")
+
+    # Rows setting the same fields share one executemany UPDATE ... WHERE id = ?
+    groups = {}
+    for item in items:
+        values = item.dict(exclude_unset=True, exclude={"id"})
+        if values:
+            groups.setdefault(tuple(sorted(values)), []).append(dict(values, _id=item.id))
+
+    def work(db: Session):
+        table = models.Item.__table__
+        updated = 0
+        try:
+            for fields, rows in groups.items():
+                statement = update(table).where(table.c.id == bindparam("_id")).values(
+                    {field: bindparam(field) for field in fields}
+                )
+                updated += db.execute(statement, rows).rowcount
+        except IntegrityError as e:
+            db.rollback()
+            raise HTTPException(status_code=409, detail=str(e.orig))
+        bump_generation(db, "items")
+        db.commit()
+        return {"updated": updated}
+
+    return await db.run(work)
+
+
+@app.post("/items/bulk-delete", response_model=schemas.BulkDeleteOut, summary="Delete many Items in one statement")
+async def delete_items(request: schemas.BulkDeleteIn, db: Database = Depends(get_async_db)):
+    if len(request.ids) > MAX_BULK_UPDATE_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_UPDATE_SIZE} ids per bulk request")
+
+    def work(db: Session):
+        deleted = db.query(models.Item).filter(models.Item.id.in_(request.ids)).delete(synchronize_session=False)
+        bump_generation(db, "items")
+        db.commit()
+        return {"deleted": deleted}
+
+    return await db.run(work)
+
+
 @app.put("/items/{item_id}", response_model=schemas.ItemOut, summary="Update an Item")
-def update_item(item_id: int, updated_item: schemas.ItemUpdate, db: Session = Depends(get_db)):
-    item = db.query(models.Item).filter(models.Item.id == item_id).first()
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
+async def update_item(item_id: int, updated_item: schemas.ItemUpdate, db: Database = Depends(get_async_db)):
+    def work(db: Session):
+        item = db.query(models.Item).filter(models.Item.id == item_id).first()
+        if not item:
+            raise HTTPException(status_code=404, detail="Item not found")
 
-    # Only update fields provided
-    update_data = updated_item.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(item, key, value)
+        # Only update fields provided
+        update_data = updated_item.dict(exclude_unset=True)
+        for key, value in update_data.items():
+            setattr(item, key, value)
+
+        bump_generation(db, "items")
+        db.commit()
+        db.refresh(item)
+        return item
+
+    return await db.run(work)
+
+@app.patch("/orders/status", response_model=schemas.BulkUpdateOut, summary="Set the status of many Orders")
+async def update_orders_status(request: schemas.OrderStatusUpdate, db: Database = Depends(get_async_db)):
+    filters = order_filters(**request.where.dict()) if request.where else []
+    if request.ids is not None:
+        if len(request.ids) > MAX_BULK_UPDATE_SIZE:
+            raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_UPDATE_SIZE} ids per bulk request")
+        filters.append(models.Order.id.in_(request.ids))
+    if not filters:
+        raise HTTPException(status_code=400, detail="Give ids or a where filter; refusing to update every order")
+    # Orders already in the target status are left alone and not counted
+    filters.append(or_(models.Order.status != request.status, models.Order.status.is_(None)))
+
+    def work(db: Session):
+        # Move the affected sales to their new status group in the rollups
+        sale_ids = [
+            sale_id for (sale_id,) in db.query(models.Sale.id)
+            .join(models.Order, models.Sale.order_id == models.Order.id).filter(*filters)
+        ]
+        rollup_sales(db, sale_ids, sign=-1)
+        updated = db.query(models.Order).filter(*filters).update(
+            {models.Order.status: request.status}, synchronize_session=False
+        )
+        rollup_sales(db, sale_ids)
+        bump_generation(db, "orders")
+        db.commit()
+        return {"updated": updated}
+
+    return await db.run(work)
 
-    db.commit()
-    db.refresh(item)
-    return item
 
 @app.put("/orders/{order_id}")
-def update_order(order_id: int, order: OrderCreate, db: Session = Depends(get_db)):
-    db_order = db.query(Order).filter(Order.id == order_id).first()
-    if not db_order:
-        raise HTTPException(status_code=404, detail="Order not found")
+async def update_order(order_id: int, order: OrderCreate, db: Database = Depends(get_async_db)):
+    def work(db: Session):
+        db_order = db.query(Order).filter(Order.id == order_id).first()
+        if not db_order:
+            raise HTTPException(status_code=404, detail="Order not found")
 
-    db_order.customer_name = order.customer_name
-    db_order.item_id = order.item_id
-    db_order.quantity = order.quantity
+        db_order.customer_name = order.customer_name
+        db_order.item_id = order.item_id
+        db_order.quantity = order.quantity
 
-    db.commit()
-    db.refresh(db_order)
-    return db_order
+        bump_generation(db, "orders")
+        db.commit()
+        db.refresh(db_order)
+        return db_order
+
+    return await db.run(work)
 
 @app.delete("/items/{item_id}")
-def delete_item(item_id: int, db: Session = Depends(get_db)):
-    try:
-        db_item = db.query(models.Item).filter(models.Item.id == item_id).first()
-        if not db_item:
-            raise HTTPException(status_code=404, detail=f"Item with id {item_id} not found")
+async def delete_item(item_id: int, db: Database = Depends(get_async_db)):
+    def work(db: Session):
+        try:
+            db_item = db.query(models.Item).filter(models.Item.id == item_id).first()
+            if not db_item:
+                raise HTTPException(status_code=404, detail=f"Item with id {item_id} not found")
 
-        db.delete(db_item)
-        db.commit()
-        return {"message": f"Item with id {item_id} deleted successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            db.delete(db_item)
+            bump_generation(db, "items")
+            db.commit()
+            return {"message": f"Item with id {item_id} deleted successfully"}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await db.run(work)
 
 @app.delete("/orders/{order_id}", response_model=dict)
-def delete_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(models.Order).filter(models.Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
+async def delete_order(order_id: int, db: Database = Depends(get_async_db)):
+    def work(db: Session):
+        order = db.query(models.Order).filter(models.Order.id == order_id).first()
+        if not order:
+            raise HTTPException(status_code=404, detail="Order not found")
 
-    db.delete(order)
-    db.commit()
-    return {"message": f"Order with id {order_id} deleted successfully"}
\ No newline at end of file
+        # The order's sales drop out of the summary along with it
+        sale_ids = [sale_id for (sale_id,) in db.query(models.Sale.id).filter(models.Sale.order_id == order_id)]
+        rollup_sales(db, sale_ids, sign=-1)
+        db.delete(order)
+        bump_generation(db, "orders")
+        bump_generation(db, "sales")
+        db.commit()
+        return {"message": f"Order with id {order_id} deleted successfully"}
+
+    return await db.run(work)
\ No newline at end of file
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy import event
+
+# Upper bounds in seconds, the Prometheus client defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class QueryStats:
+    """Query count and time of one request, shared with the threads and greenlets it runs on"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+class Metrics:
+    """In-process request and database metrics, rendered in Prometheus text format.
+
+    Each worker process keeps its own counters.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = defaultdict(int)  # (method, route, status) -> count
+        self.latency = {}  # (method, route) -> [bucket counts..., sum, count]
+        self.db_queries = defaultdict(int)  # (method, route) -> count
+        self.db_seconds = defaultdict(float)  # (method, route) -> seconds
+
+    def observe(self, method: str, route: str, status: int, seconds: float, queries: QueryStats):
+        with self.lock:
+            self.requests[(method, route, status)] += 1
+            histogram = self.latency.setdefault((method, route), [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            self.db_queries[(method, route)] += queries.count
+            self.db_seconds[(method, route)] += queries.seconds
+
+    def render(self) -> str:
+        with self.lock:
+            lines = [
+                "# HELP http_requests_in_flight Requests currently being served.",
+                "# TYPE http_requests_in_flight gauge",
+                f"http_requests_in_flight {self.in_flight}",
+                "# HELP http_requests_total Requests served, by route and status code.",
+                "# TYPE http_requests_total counter",
+            ]
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+
+            lines += [
+                "# HELP http_request_duration_seconds Time to produce the response headers.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), histogram in sorted(self.latency.items()):
+                labels = f'method="{method}",route="{route}"'
+                for bound, count in zip(self.buckets, histogram):
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram[-1]}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {histogram[-2]}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {histogram[-1]}")
+
+            lines += [
+                "# HELP db_queries_total SQL statements executed while serving requests.",
+                "# TYPE db_queries_total counter",
+            ]
+            for (method, route), count in sorted(self.db_queries.items()):
+                lines.append(f'db_queries_total{{method="{method}",route="{route}"}} {count}')
+            lines += [
+                "# HELP db_query_seconds_total Time spent executing SQL statements.",
+                "# TYPE db_query_seconds_total counter",
+            ]
+            for (method, route), seconds in sorted(self.db_seconds.items()):
+                lines.append(f'db_query_seconds_total{{method="{method}",route="{route}"}} {seconds}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def instrument_engine(engine):
+    """Count and time every statement run on the engine against the current request"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = _query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+
+
+async def timing_middleware(request: Request, call_next):
+    """Record latency, status and DB work per route, and report them in a Server-Timing header"""
+    stats = QueryStats()
+    token = _query_stats.set(stats)
+    with metrics.lock:
+        metrics.in_flight += 1
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - start
+        with metrics.lock:
+            metrics.in_flight -= 1
+        # The route template keeps label cardinality bounded, unlike the raw path
+        route = request.scope.get("route")
+        metrics.observe(request.method, route.path if route else "<unmatched>", status, elapsed, stats)
+        _query_stats.reset(token)
+
+    response.headers["Server-Timing"] = (
+        f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries", app;dur={elapsed * 1000:.1f}'
+    )
+    return response
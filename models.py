@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, UniqueConstraint, Text, Date, DateTime, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -10,6 +12,9 @@ class Item(Base):
     name = Column(String(255), nullable=False)
     price = Column(Float, nullable=False)
 
+    # Natural key used by the Django sync to find an item without scanning the table
+    __table_args__ = (UniqueConstraint("name", "price", name="uq_items_name_price"),)
+
 
 class Order(Base):
     __tablename__ = "orders"
@@ -21,6 +26,12 @@ class Order(Base):
 
     item = relationship("Item")
 
+    # Filtered list queries seek on the filter column and page through ids in index order
+    __table_args__ = (
+        Index("ix_orders_status_id", "status", "id"),
+        Index("ix_orders_item_id_id", "item_id", "id"),
+    )
+
 
 class Sale(Base):
     __tablename__ = "sales"
@@ -28,5 +39,45 @@ class Sale(Base):
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"))
     total = Column(Float, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
 
     order = relationship("Order")
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(255), nullable=False, unique=True, index=True)
+    path = Column(String(255), nullable=False)
+    # sha256 of the request body, so a key reused for a different payload is refused
+    request_hash = Column(String(64), nullable=True)
+    # Empty while the first request with this key is still being processed
+    status_code = Column(Integer, nullable=True)
+    response = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+
+class CacheGeneration(Base):
+    __tablename__ = "cache_generations"
+
+    # Bumped on every write to the named table so cached reads can detect staleness
+    name = Column(String(50), primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+
+
+class SalesRollup(Base):
+    __tablename__ = "sales_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # "day" or "week"; bucket is the first day of the period
+    period = Column(String(10), nullable=False)
+    bucket = Column(Date, nullable=False)
+    item_id = Column(Integer, ForeignKey("items.id"))
+    status = Column(String(50))
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        UniqueConstraint("period", "bucket", "item_id", "status", name="uq_sales_rollups_key"),
+    )
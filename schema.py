@@ -0,0 +1,101 @@
+from datetime import datetime
+
+from sqlalchemy import Column, MetaData, String, Table, inspect, select, text, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from analytics import rebuild_rollups
+from cache import bump_generation
+from database import Base
+import models  # registers the tables on Base.metadata
+
+# Base.metadata.create_all only creates missing tables. Changes to tables that
+# already exist are applied by these steps, each run once per database and
+# recorded in schema_upgrades. Steps check the live schema first, so on a
+# database that create_all just built they only get recorded.
+upgrades = Table(
+    "schema_upgrades",
+    MetaData(),
+    Column("name", String(100), primary_key=True),
+)
+
+
+def add_items_natural_key(conn: Connection):
+    """Merge duplicate (name, price) items into the oldest one, then add uq_items_name_price"""
+    inspector = inspect(conn)
+    names = {c["name"] for c in inspector.get_unique_constraints("items")}
+    names |= {i["name"] for i in inspector.get_indexes("items")}
+    if "uq_items_name_price" in names:
+        return
+    keeper = (
+        "SELECT MIN(k.id) FROM items k JOIN items i ON k.name = i.name AND k.price = i.price"
+        " WHERE i.id = orders.item_id"
+    )
+    duplicate = "EXISTS (SELECT 1 FROM items k WHERE k.name = items.name AND k.price = items.price AND k.id < items.id)"
+    conn.execute(text(
+        f"UPDATE orders SET item_id = ({keeper})"
+        f" WHERE item_id IN (SELECT id FROM items WHERE {duplicate})"
+    ))
+    conn.execute(text(f"DELETE FROM items WHERE {duplicate}"))
+    conn.execute(text("CREATE UNIQUE INDEX uq_items_name_price ON items (name, price)"))
+
+
+def create_missing_indexes(conn: Connection, table: Table):
+    existing = {i["name"] for i in inspect(conn).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(conn)
+
+
+def add_order_filter_indexes(conn: Connection):
+    """ix_orders_status_id and ix_orders_item_id_id, used by the filtered GET /orders"""
+    create_missing_indexes(conn, models.Order.__table__)
+
+
+def add_sales_created_at(conn: Connection):
+    """Sale.created_at for the rollups; sales that predate it are stamped with the upgrade time"""
+    sales = models.Sale.__table__
+    if "created_at" not in {c["name"] for c in inspect(conn).get_columns("sales")}:
+        column_type = sales.c.created_at.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE sales ADD COLUMN created_at {column_type}"))
+        conn.execute(update(sales).values(created_at=datetime.utcnow()))
+        # SQLite can't add NOT NULL to an existing column; the ORM default still fills it
+        if conn.dialect.name != "sqlite":
+            conn.execute(text("ALTER TABLE sales ALTER COLUMN created_at SET NOT NULL"))
+    create_missing_indexes(conn, sales)
+
+
+def rebuild_sales_rollups(conn: Connection):
+    """Roll up the sales written before sales_rollups was maintained"""
+    with Session(bind=conn) as db:
+        rebuild_rollups(db)
+        # Summaries cached or ETagged before the rebuild are stale
+        bump_generation(db, "sales")
+        db.flush()
+
+
+def add_idempotency_request_hash(conn: Connection):
+    """IdempotencyKey.request_hash; keys stored before it replay without a body check"""
+    if "request_hash" not in {c["name"] for c in inspect(conn).get_columns("idempotency_keys")}:
+        column_type = models.IdempotencyKey.__table__.c.request_hash.type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE idempotency_keys ADD COLUMN request_hash {column_type}"))
+
+
+STEPS = [
+    add_items_natural_key,
+    add_order_filter_indexes,
+    add_sales_created_at,
+    rebuild_sales_rollups,
+    add_idempotency_request_hash,
+]
+
+
+def upgrade_schema(conn: Connection):
+    """Create missing tables, then run the upgrade steps this database hasn't had yet"""
+    Base.metadata.create_all(conn)
+    upgrades.create(conn, checkfirst=True)
+    applied = set(conn.execute(select(upgrades.c.name)).scalars())
+    for step in STEPS:
+        if step.__name__ not in applied:
+            step(conn)
+            conn.execute(upgrades.insert().values(name=step.__name__))
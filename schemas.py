@@ -1,5 +1,7 @@
+from datetime import date
+
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 
 class ItemBase(BaseModel):
@@ -17,6 +19,10 @@ class ItemUpdate(BaseModel):
     price: Optional[float] = None
 
 
+class ItemBulkUpdate(ItemUpdate):
+    id: int
+
+
 class ItemOut(ItemBase):
     id: int
 
@@ -41,6 +47,24 @@ class OrderOut(OrderBase):
         from_attributes = True
 
 
+class OrderFilter(BaseModel):
+    status: Optional[str] = None
+    item_id: Optional[int] = None
+    min_id: Optional[int] = None
+    max_id: Optional[int] = None
+
+
+class OrderStatusUpdate(BaseModel):
+    status: str
+    # Orders to update: the listed ids, the ones matching `where`, or both combined
+    ids: Optional[List[int]] = None
+    where: Optional[OrderFilter] = None
+
+
+class OrderWithItemOut(OrderOut):
+    item: Optional[ItemOut] = None
+
+
 class SaleBase(BaseModel):
     order_id: int
     total: float
@@ -51,3 +75,87 @@ class SaleOut(SaleBase):
 
     class Config:
         from_attributes = True
+
+
+class ItemPage(BaseModel):
+    items: List[ItemOut]
+    next_cursor: Optional[str] = None
+
+
+class OrderPage(BaseModel):
+    items: List[OrderOut]
+    next_cursor: Optional[str] = None
+
+
+class OrderWithItemPage(BaseModel):
+    items: List[OrderWithItemOut]
+    next_cursor: Optional[str] = None
+
+
+class SalePage(BaseModel):
+    items: List[SaleOut]
+    next_cursor: Optional[str] = None
+
+
+class SalesByItem(BaseModel):
+    item_id: Optional[int] = None
+    name: Optional[str] = None
+    count: int
+    total: float
+    average: float
+
+
+class SalesByStatus(BaseModel):
+    status: Optional[str] = None
+    count: int
+    total: float
+    average: float
+
+
+class SalesByBucket(BaseModel):
+    bucket: date
+    count: int
+    total: float
+    average: float
+
+
+class SalesSummary(BaseModel):
+    by_item: List[SalesByItem]
+    by_status: List[SalesByStatus]
+    buckets: List[SalesByBucket] = []
+
+
+class BulkCreateOut(BaseModel):
+    ids: List[int]
+
+
+class BulkDeleteIn(BaseModel):
+    ids: List[int]
+
+
+class BulkUpdateOut(BaseModel):
+    updated: int
+
+
+class BulkDeleteOut(BaseModel):
+    deleted: int
+
+
+class CompositeOrderLine(BaseModel):
+    name: str
+    price: float
+    quantity: int
+    # Skips the (name, price) lookup when the client already knows the item
+    item_id: Optional[int] = None
+
+
+class CompositeOrderCreate(BaseModel):
+    lines: List[CompositeOrderLine]
+    status: Optional[str] = "pending"
+    total: float
+
+
+class CompositeOrderOut(BaseModel):
+    item_ids: List[int]
+    order_ids: List[int]
+    sale_id: Optional[int] = None
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.db import models
-from .models import Category, Product, Order, OrderItem
+from .models import Category, Product, Order, OrderItem, FastAPIOutbox, InventoryHold
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -45,6 +45,20 @@ class OrderItemInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ("id", "created", "status", "paid", "total_amount", "user", "guest_email")
+    list_display = ("id", "created", "status", "paid", "total", "user", "guest_email")
     list_filter = ("status", "paid", "created")
+    list_select_related = ("user",)
+    # Maintained from the order lines
+    readonly_fields = ("total",)
     inlines = [OrderItemInline]
+
+@admin.register(FastAPIOutbox)
+class FastAPIOutboxAdmin(admin.ModelAdmin):
+    list_display = ("id", "order", "status", "attempts", "next_attempt_at", "updated")
+    list_filter = ("status",)
+    raw_id_fields = ("order",)
+
+@admin.register(InventoryHold)
+class InventoryHoldAdmin(admin.ModelAdmin):
+    list_display = ("id", "product", "hold_key", "quantity", "expires_at")
+    raw_id_fields = ("product",)
@@ -1,5 +1,6 @@
 from decimal import Decimal
 from .models import Product
+from .inventory import hold_key_for, place_hold, release_holds
 
 CART_SESSION_ID = 'cart'
 
@@ -12,23 +13,30 @@ class Cart:
         self.cart = cart
 
     def add(self, product_id, quantity=1, update_quantity=False):
+        """Add to the cart and hold the units; raises InsufficientInventory, leaving the cart as it was"""
         product = Product.objects.get(id=product_id)
         pid = str(product_id)
+        current = self.cart[pid]['quantity'] if pid in self.cart else 0
+        new_quantity = quantity if update_quantity else current + quantity
+        place_hold(product, self.hold_key, new_quantity)
         if pid not in self.cart:
             self.cart[pid] = {'quantity': 0, 'price': str(product.price), 'title': product.title}
-        if update_quantity:
-            self.cart[pid]['quantity'] = quantity
-        else:
-            self.cart[pid]['quantity'] += quantity
+        self.cart[pid]['quantity'] = new_quantity
         self.save()
 
+    @property
+    def hold_key(self):
+        return hold_key_for(self.session)
+
     def remove(self, product_id):
         pid = str(product_id)
         if pid in self.cart:
             del self.cart[pid]
+            release_holds(self.hold_key, [product_id])
             self.save()
 
     def clear(self):
+        release_holds(self.hold_key)
         self.session[CART_SESSION_ID] = {}
         self.save()
 
@@ -36,7 +44,8 @@ class Cart:
         product_ids = self.cart.keys()
         products = Product.objects.filter(id__in=product_ids)
         for product in products:
-            item = self.cart[str(product.id)]
+            # A copy, so the Product and Decimals never end up in the session
+            item = dict(self.cart[str(product.id)])
             item['product'] = product
             item['price'] = Decimal(item['price'])
             item['total_price'] = item['price'] * item['quantity']
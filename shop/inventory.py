@@ -0,0 +1,125 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import InventoryHold, OrderItem, Product
+
+HOLD_KEY_SESSION_ID = 'cart_hold_key'
+
+
+class InsufficientInventory(Exception):
+    """A line asked for more units than are in stock; the caller's transaction must roll back"""
+
+    def __init__(self, product, available):
+        self.product = product
+        self.available = available
+        super().__init__(f"Insufficient inventory for {product.title}. Available: {available}")
+
+
+def hold_key_for(session):
+    """The cart's hold id, created on first use and kept in the session"""
+    hold_key = session.get(HOLD_KEY_SESSION_ID)
+    if not hold_key:
+        hold_key = session[HOLD_KEY_SESSION_ID] = uuid.uuid4().hex
+    return hold_key
+
+
+def held_quantity(exclude_hold_key=None):
+    """Subquery summing the live holds on the outer product, via the (product, expires_at) index"""
+    holds = InventoryHold.objects.filter(product=OuterRef('pk'), expires_at__gt=timezone.now())
+    if exclude_hold_key:
+        holds = holds.exclude(hold_key=exclude_hold_key)
+    total = holds.order_by().values('product').annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(total), Value(0))
+
+
+def with_available(queryset, exclude_hold_key=None):
+    """Annotate products with `available`: inventory minus units held by other live carts"""
+    return queryset.annotate(available=F('inventory') - held_quantity(exclude_hold_key))
+
+
+def place_hold(product, hold_key, quantity):
+    """Hold `quantity` units of the product for the cart, replacing its previous hold and TTL.
+
+    Raises InsufficientInventory, leaving the previous hold alone, when other carts'
+    live holds leave too few units.
+    """
+    if quantity <= 0:
+        release_holds(hold_key, [product.pk])
+        return
+    with transaction.atomic():
+        # The check and the write must not interleave with another cart's. On PostgreSQL the
+        # product row lock serializes them; SQLite ignores FOR UPDATE, but the IMMEDIATE
+        # transaction mode (settings.DATABASES) takes the write lock before this read
+        available = (
+            with_available(Product.objects.select_for_update().filter(pk=product.pk), exclude_hold_key=hold_key)
+            .values_list('available', flat=True).get()
+        )
+        if quantity > available:
+            raise InsufficientInventory(product, max(available, 0))
+        expires_at = timezone.now() + timedelta(seconds=settings.CART_HOLD_TTL_SECONDS)
+        InventoryHold.objects.update_or_create(
+            hold_key=hold_key, product=product, defaults={'quantity': quantity, 'expires_at': expires_at}
+        )
+
+
+def release_holds(hold_key, product_ids=None):
+    holds = InventoryHold.objects.filter(hold_key=hold_key)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    holds.delete()
+
+
+def decrement_stock(product, quantity, hold_key=None):
+    """UPDATE ... SET inventory = inventory - q WHERE inventory - <other carts' live holds> >= q.
+
+    The condition is evaluated against the committed row, so concurrent checkouts
+    cannot both take the last units the way a read-then-save would.
+    """
+    updated = (
+        Product.objects.filter(pk=product.pk, inventory__gte=Value(quantity) + held_quantity(hold_key))
+        .update(inventory=F('inventory') - quantity, updated=timezone.now())
+    )
+    if not updated:
+        available = with_available(Product.objects.filter(pk=product.pk), hold_key).values_list('available', flat=True).first()
+        raise InsufficientInventory(product, max(available or 0, 0))
+
+
+def create_order_lines(order, lines, hold_key=None):
+    """Take stock for every (product, price, quantity) line and insert the order lines in one query.
+
+    The cart's own holds (`hold_key`) count as available and are converted into the
+    sale. Must run inside transaction.atomic(); raises InsufficientInventory on the
+    first short line, leaving the rollback to the caller.
+    """
+    # A fixed lock order keeps two checkouts of the same products from deadlocking
+    lines = sorted(lines, key=lambda line: line[0].pk)
+    product_ids = [product.pk for product, price, quantity in lines]
+    list(Product.objects.select_for_update().filter(pk__in=product_ids).order_by('pk').values_list('pk'))
+    for product, price, quantity in lines:
+        decrement_stock(product, quantity, hold_key)
+    if hold_key:
+        release_holds(hold_key, product_ids)
+    # bulk_create skips OrderItem.save, so store the order total here
+    order.total = sum(price * quantity for product, price, quantity in lines)
+    order.save(update_fields=['total'])
+    return OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=product, price=price, quantity=quantity)
+        for product, price, quantity in lines
+    ])
+
+
+def expire_holds(batch_size=1000, now=None):
+    """Delete one batch of expired holds, oldest first; returns how many were deleted"""
+    expired = list(
+        InventoryHold.objects.filter(expires_at__lte=now or timezone.now())
+        .order_by('expires_at').values_list('pk', flat=True)[:batch_size]
+    )
+    if expired:
+        InventoryHold.objects.filter(pk__in=expired).delete()
+    return len(expired)
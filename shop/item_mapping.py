@@ -0,0 +1,88 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import FastAPIItemMapping
+
+
+def fingerprint(product):
+    """Hash of the fields FastAPI uses as the item's natural key"""
+    key = f"{product.title}|{float(product.price)!r}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class LRUCache:
+    """Small thread-safe LRU, used here for product id -> (fingerprint, item id)"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+cache = LRUCache(getattr(settings, 'FASTAPI_ITEM_CACHE_SIZE', 1024))
+
+
+def resolve_many(products):
+    """Return {product id: FastAPI item id} for products with a current mapping.
+
+    Checks the in-process LRU first and loads the rest with a single query.
+    Mappings whose fingerprint no longer matches the product are ignored.
+    """
+    resolved = {}
+    missing = {}
+    for product in products:
+        fp = fingerprint(product)
+        cached = cache.get(product.id)
+        if cached and cached[0] == fp:
+            resolved[product.id] = cached[1]
+        else:
+            missing[product.id] = fp
+
+    if missing:
+        for mapping in FastAPIItemMapping.objects.filter(product_id__in=missing):
+            if mapping.fingerprint == missing[mapping.product_id]:
+                resolved[mapping.product_id] = mapping.item_id
+                cache.set(mapping.product_id, (mapping.fingerprint, mapping.item_id))
+    return resolved
+
+
+def store(product, item_id):
+    fp = fingerprint(product)
+    FastAPIItemMapping.objects.update_or_create(
+        product_id=product.id, defaults={'fingerprint': fp, 'item_id': item_id}
+    )
+    cache.set(product.id, (fp, item_id))
+
+
+def invalidate_stale(product):
+    """Forget the mapping of a product whose title or price no longer matches it"""
+    fp = fingerprint(product)
+    cached = cache.get(product.id)
+    if cached and cached[0] != fp:
+        cache.pop(product.id)
+    FastAPIItemMapping.objects.filter(product_id=product.id).exclude(fingerprint=fp).delete()
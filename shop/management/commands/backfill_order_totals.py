@@ -0,0 +1,32 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored Order.total of shop (and cart) orders from their lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of orders updated per UPDATE statement',
+        )
+
+    def handle(self, *args, **options):
+        models = [apps.get_model('shop', 'Order')]
+        if apps.is_installed('cart'):
+            models.append(apps.get_model('cart', 'Order'))
+
+        batch_size = options['batch_size']
+        for model in models:
+            updated = 0
+            last_id = 0
+            while True:
+                # Keyset batches keep each transaction short on large tables
+                ids = list(model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                updated += model.objects.filter(pk__in=ids).recalculate_totals()
+                last_id = ids[-1]
+            self.stdout.write(self.style.SUCCESS(f'Backfilled {updated} {model._meta.label} totals'))
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop.inventory import expire_holds
+
+
+class Command(BaseCommand):
+    help = 'Delete expired cart inventory holds in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of expired holds to delete per query',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=60.0,
+            help='Seconds to sleep when no holds have expired',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Sweep once and exit instead of polling',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            deleted = expire_holds(options['batch_size'])
+            total += deleted
+            if deleted:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Expired {total} holds'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from shop.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index from the product table'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stdout.write('Search reads the product table through its GIN index; nothing to rebuild')
+            return
+        with transaction.atomic():
+            count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products'))
@@ -0,0 +1,103 @@
+from datetime import timedelta
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, prefetch_related_objects
+from django.utils import timezone
+from shop.models import FastAPIOutbox, Order
+from shop.fastapi_client import FastAPIClient
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Push queued Django orders from the outbox to FastAPI'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Number of outbox rows to load per batch',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=10,
+            help='Mark a row as failed after this many attempts',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to sleep when the outbox is empty',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the outbox once and exit instead of polling',
+        )
+
+    def handle(self, *args, **options):
+        fastapi_client = FastAPIClient()
+        while True:
+            processed = self.process_batch(fastapi_client, options['batch_size'], options['max_attempts'])
+            if processed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+
+    def process_batch(self, fastapi_client, batch_size, max_attempts):
+        rows = list(
+            FastAPIOutbox.objects
+            .filter(status=FastAPIOutbox.STATUS_PENDING, next_attempt_at__lte=timezone.now())
+            .select_related('order')
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if not rows:
+            return 0
+        prefetch_related_objects([row.order for row in rows], 'items__product')
+
+        # Each order is pushed on its own with its own idempotency key, so a retry
+        # replays exactly what the failed attempt sent and one bad order can't fail others
+        done, failed = [], []
+        for row in rows:
+            if row.order.fastapi_synced_at:
+                # Already pushed by sync_to_fastapi
+                done.append(row)
+                continue
+            try:
+                fastapi_client.push_order(row.order)
+            except Exception as e:
+                logger.error(f"Failed to sync outbox row {row.id} (order {row.order_id}): {e}")
+                self.schedule_retry(row, max_attempts, str(e))
+                failed.append(row)
+            else:
+                done.append(row)
+
+        now = timezone.now()
+        if done:
+            FastAPIOutbox.objects.filter(id__in=[row.id for row in done]).update(
+                status=FastAPIOutbox.STATUS_DONE, attempts=F('attempts') + 1, last_error='', updated=now
+            )
+            Order.objects.filter(id__in=[row.order_id for row in done], fastapi_synced_at__isnull=True).update(
+                fastapi_synced_at=now
+            )
+        if failed:
+            FastAPIOutbox.objects.bulk_update(failed, ['attempts', 'last_error', 'status', 'next_attempt_at', 'updated'])
+            self.stdout.write(self.style.WARNING(f'Failed to sync {len(failed)} orders, will retry'))
+        self.stdout.write(self.style.SUCCESS(f'Synced {len(done)} orders'))
+        # Failed rows were pushed into the future, so draining continues with the next due rows
+        return len(rows)
+
+    def schedule_retry(self, row, max_attempts, error):
+        # Exponential backoff with jitter, capped at 10 minutes
+        row.attempts += 1
+        row.last_error = error
+        if row.attempts >= max_attempts:
+            row.status = FastAPIOutbox.STATUS_FAILED
+        else:
+            row.next_attempt_at = timezone.now() + timedelta(seconds=min(600, 2 ** row.attempts) * random.uniform(0.5, 1.0))
+        row.updated = timezone.now()
@@ -1,10 +1,19 @@
-from django.core.management.base import BaseCommand
-from shop.models import Order
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+from django.utils import timezone
+from shop.models import FastAPIOutbox, Order, SyncWatermark
 from shop.fastapi_client import FastAPIClient
+from shop import item_mapping
 import logging
 
 logger = logging.getLogger(__name__)
 
+WATERMARK_NAME = 'fastapi_orders'
+
 class Command(BaseCommand):
     help = 'Sync existing Django orders to FastAPI'
 
@@ -19,6 +28,28 @@ class Command(BaseCommand):
             action='store_true',
             help='Sync all orders',
         )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Sync orders updated since the last successful sync',
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Sync orders updated after this ISO datetime',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of orders to sync concurrently',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Number of orders loaded from the database at a time',
+        )
 
     def handle(self, *args, **options):
         fastapi_client = FastAPIClient()
@@ -26,22 +57,102 @@ class Command(BaseCommand):
         if options['order_id']:
             try:
                 order = Order.objects.get(id=options['order_id'])
-                self.sync_order(fastapi_client, order)
+                if order.fastapi_synced_at:
+                    self.stdout.write(
+                        self.style.WARNING(f'Order {order.id} was already synced at {order.fastapi_synced_at}')
+                    )
+                elif self.sync_order(fastapi_client, order):
+                    Order.objects.filter(id=order.id).update(fastapi_synced_at=timezone.now())
             except Order.DoesNotExist:
                 self.stdout.write(
                     self.style.ERROR(f'Order {options["order_id"]} not found')
                 )
-        elif options['all']:
-            orders = Order.objects.all()
+        elif options['all'] or options['incremental'] or options['since']:
+            since = self.get_since(options)
+            # The FastAPI ids of a pushed order aren't kept, so later changes can't be sent and
+            # re-pushing would duplicate it; each order is created there once. Orders still
+            # queued in the outbox are left to run_outbox.
+            orders = Order.objects.filter(fastapi_synced_at__isnull=True).exclude(
+                fastapi_outbox__status=FastAPIOutbox.STATUS_PENDING
+            )
+            if since:
+                orders = orders.filter(updated__gt=since)
+            orders = orders.order_by('updated', 'id').prefetch_related('items__product')
             self.stdout.write(f'Syncing {orders.count()} orders to FastAPI...')
-            for order in orders:
-                self.sync_order(fastapi_client, order)
+            self.sync_orders(fastapi_client, orders, options['workers'], options['chunk_size'])
         else:
             self.stdout.write(
-                self.style.ERROR('Please specify --order-id or --all')
+                self.style.ERROR('Please specify --order-id, --all, --incremental or --since')
             )
 
-    def sync_order(self, fastapi_client, order):
+    def get_since(self, options):
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f'Invalid --since datetime: {options["since"]}')
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            return since
+        if options['incremental']:
+            watermark = SyncWatermark.objects.filter(name=WATERMARK_NAME).first()
+            return watermark.value if watermark else None
+        return None
+
+    def sync_orders(self, fastapi_client, orders, workers, chunk_size):
+        start = time.perf_counter()
+        self.synced = self.failed = 0
+        self.watermark = None
+        self.watermark_blocked = False
+
+        executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            chunk = []
+            for order in orders.iterator(chunk_size=chunk_size):
+                chunk.append(order)
+                if len(chunk) == chunk_size:
+                    self.sync_chunk(fastapi_client, chunk, executor)
+                    chunk = []
+            if chunk:
+                self.sync_chunk(fastapi_client, chunk, executor)
+        finally:
+            if executor:
+                executor.shutdown()
+
+        if self.watermark:
+            SyncWatermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'value': self.watermark})
+
+        elapsed = time.perf_counter() - start
+        rate = self.synced / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(f'Synced {self.synced} orders, {self.failed} failed in {elapsed:.2f}s ({rate:.1f} orders/sec)')
+        )
+
+    def sync_chunk(self, fastapi_client, chunk, executor):
+        # Load the item mappings of the whole chunk in one query so worker threads hit the warm cache
+        item_mapping.resolve_many(order_item.product for order in chunk for order_item in order.items.all())
+
+        if executor is None:
+            results = [self.sync_order(fastapi_client, order) for order in chunk]
+        else:
+            results = list(executor.map(lambda order: self.sync_order(fastapi_client, order, in_thread=True), chunk))
+        self.tally(chunk, results)
+
+    def tally(self, chunk, results):
+        """Count successes, record them on the orders and advance the watermark up to the first failed order"""
+        synced_ids = []
+        for order, success in zip(chunk, results):
+            if success:
+                self.synced += 1
+                synced_ids.append(order.id)
+                if not self.watermark_blocked and order.updated:
+                    self.watermark = order.updated
+            else:
+                self.failed += 1
+                self.watermark_blocked = True
+        if synced_ids:
+            Order.objects.filter(id__in=synced_ids).update(fastapi_synced_at=timezone.now())
+
+    def sync_order(self, fastapi_client, order, in_thread=False):
         try:
             success = fastapi_client.sync_order_to_fastapi(order)
             if success:
@@ -52,7 +163,13 @@ class Command(BaseCommand):
                 self.stdout.write(
                     self.style.WARNING(f'Failed to sync order {order.id}')
                 )
+            return success
         except Exception as e:
             self.stdout.write(
                 self.style.ERROR(f'Error syncing order {order.id}: {e}')
             )
+            return False
+        finally:
+            # Worker threads get their own database connection; don't leak it
+            if in_thread:
+                connection.close()
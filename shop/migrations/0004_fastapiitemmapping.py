@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_alter_order_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FastAPIItemMapping',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fastapi_mapping', serialize=False, to='shop.product')),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('item_id', models.PositiveIntegerField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
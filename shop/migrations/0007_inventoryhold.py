@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_order_sync_watermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hold_key', models.CharField(max_length=32)),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='shop.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'expires_at'], name='shop_invent_product_cee1c9_idx'), models.Index(fields=['expires_at'], name='shop_invent_expires_614572_idx')],
+                'constraints': [models.UniqueConstraint(fields=('hold_key', 'product'), name='unique_hold_per_cart_line')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:29
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    """Existing orders get the sum of their lines, as Order.objects.recalculate_totals() does"""
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    money = DecimalField(max_digits=12, decimal_places=2)
+    lines = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    total = lines.annotate(total=Sum(F('price') * F('quantity'), output_field=money)).values('total')
+    Order.objects.update(total=Coalesce(Subquery(total), Value(Decimal('0')), output_field=money))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_inventoryhold'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
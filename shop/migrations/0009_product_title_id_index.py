@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_order_total'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['title', 'id'], name='shop_produc_title_fe6c35_idx'),
+        ),
+    ]
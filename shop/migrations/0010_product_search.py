@@ -0,0 +1,39 @@
+from django.db import migrations
+
+FTS_TABLE = 'shop_product_fts'
+GIN_INDEX = 'shop_product_search_gin'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        # prefix='2 3' adds prefix indexes so short "ab"* queries avoid a term scan
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"title, description, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description) SELECT id, title, description FROM shop_product'
+        )
+    elif schema_editor.connection.vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        from shop.search import search_vector
+        Product = apps.get_model('shop', 'Product')
+        schema_editor.add_index(Product, GinIndex(search_vector(), name=GIN_INDEX))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {GIN_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_product_title_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:56
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def mark_synced_orders(apps, schema_editor):
+    """Orders already pushed by the outbox or covered by the sync watermark"""
+    Order = apps.get_model('shop', 'Order')
+    FastAPIOutbox = apps.get_model('shop', 'FastAPIOutbox')
+    SyncWatermark = apps.get_model('shop', 'SyncWatermark')
+    done = FastAPIOutbox.objects.filter(order=OuterRef('pk'), status='done').order_by('-updated')
+    Order.objects.filter(fastapi_outbox__status='done').update(fastapi_synced_at=Subquery(done.values('updated')[:1]))
+    watermark = SyncWatermark.objects.filter(name='fastapi_orders').first()
+    if watermark and watermark.value:
+        Order.objects.filter(fastapi_synced_at__isnull=True, updated__lte=watermark.value).update(
+            fastapi_synced_at=watermark.value
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='fastapi_synced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_synced_orders, migrations.RunPython.noop),
+    ]
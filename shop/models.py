@@ -1,5 +1,12 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.text import slugify
 
 User = get_user_model()
@@ -38,7 +45,8 @@ class Product(TimeStampedModel):
 
     class Meta:
         ordering = ['title']
-        indexes = [models.Index(fields=['slug'])]
+        # (title, id) serves the keyset-paginated product listing
+        indexes = [models.Index(fields=['slug']), models.Index(fields=['title', 'id'])]
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -48,6 +56,43 @@ class Product(TimeStampedModel):
     def __str__(self):
         return self.title
 
+class OrderQuerySet(models.QuerySet):
+    def line_total(self):
+        """SQL expression for the sum of an order's lines, correlated on the outer order"""
+        money = DecimalField(max_digits=12, decimal_places=2)
+        lines = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+        total = lines.annotate(total=Sum(F('price') * F('quantity'), output_field=money)).values('total')
+        return Coalesce(Subquery(total), Value(Decimal('0')), output_field=money)
+
+    def with_line_total(self):
+        """Annotate `line_total` computed from the lines, e.g. to audit the stored totals"""
+        return self.annotate(line_total=self.line_total())
+
+    def recalculate_totals(self):
+        """Store each order's total from its lines in one UPDATE"""
+        return self.update(total=self.line_total())
+
+
+@receiver(post_save, sender=Product)
+def sync_saved_product(sender, instance, update_fields=None, **kwargs):
+    # A signal rather than Product.save so loaddata's raw saves are covered too.
+    # Saves limited by update_fields skip the work their fields can't affect.
+    if update_fields is None or {'title', 'price'} & update_fields:
+        # Drop the FastAPI item mapping if title or price changed
+        from .item_mapping import invalidate_stale
+        invalidate_stale(instance)
+    if update_fields is None or {'title', 'description'} & update_fields:
+        from .search import index_product
+        index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    # A signal rather than Product.delete so queryset and cascade deletes are covered too
+    from .search import unindex_product
+    unindex_product(instance.pk)
+
+
 class Order(TimeStampedModel):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, related_name='shop_orders')
     guest_email = models.EmailField(blank=True, null=True)
@@ -66,13 +111,22 @@ class Order(TimeStampedModel):
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
     ])
+    # Sum of the order lines, kept current when lines are written
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Set once the order exists in FastAPI, by run_outbox or sync_to_fastapi
+    fastapi_synced_at = models.DateTimeField(blank=True, null=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['updated', 'id'])]
 
     def __str__(self):
         return f"Order #{self.pk} - {self.created:%Y-%m-%d}"
 
     @property
     def total_amount(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.total
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -84,5 +138,80 @@ class OrderItem(models.Model):
     def total_price(self):
         return self.price * self.quantity
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.update_order_total()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.update_order_total()
+        return result
+
+    def update_order_total(self):
+        Order.objects.filter(pk=self.order_id).recalculate_totals()
+        # Keep an order instance the caller still holds in step with the database
+        if OrderItem.order.is_cached(self):
+            self.order.refresh_from_db(fields=['total'])
+
     def __str__(self):
         return f"{self.product} x {self.quantity}"
+
+
+class InventoryHold(models.Model):
+    """Units of a product set aside for one cart until expires_at"""
+    product = models.ForeignKey(Product, related_name='holds', on_delete=models.CASCADE)
+    # Random id kept in the cart's session, so holds survive the session key changing at login
+    hold_key = models.CharField(max_length=32)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['hold_key', 'product'], name='unique_hold_per_cart_line')]
+        # (product, expires_at) serves the live-holds sum per product; expires_at the sweeper
+        indexes = [models.Index(fields=['product', 'expires_at']), models.Index(fields=['expires_at'])]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for {self.hold_key} until {self.expires_at:%H:%M}"
+
+
+class FastAPIItemMapping(models.Model):
+    """Which FastAPI item a product was synced as, valid while its fingerprint matches"""
+    product = models.OneToOneField(Product, primary_key=True, related_name='fastapi_mapping', on_delete=models.CASCADE)
+    fingerprint = models.CharField(max_length=40)
+    item_id = models.PositiveIntegerField()
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.item_id}"
+
+
+class FastAPIOutbox(TimeStampedModel):
+    """Orders waiting to be pushed to FastAPI, written in the checkout transaction"""
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    order = models.ForeignKey(Order, related_name='fastapi_outbox', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, default=STATUS_PENDING, choices=[
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ])
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"Outbox #{self.pk} for order {self.order_id} ({self.status})"
+
+
+class SyncWatermark(models.Model):
+    """Last Order.updated value pushed to FastAPI by an incremental sync"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
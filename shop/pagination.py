@@ -0,0 +1,42 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.db.models import Q
+
+# The fields a product card renders; everything else stays deferred
+PRODUCT_CARD_FIELDS = ('title', 'slug', 'price', 'inventory', 'image', 'category__name', 'category__slug')
+
+
+def encode_cursor(product):
+    return base64.urlsafe_b64encode(json.dumps([product.title, product.pk]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(title, id) of the last product on the previous page, or None for a bad cursor"""
+    try:
+        title, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(title), int(pk)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+
+def product_page(queryset, after=None, page_size=None):
+    """One page of product cards in (title, id) order, seeking past `after` instead of using OFFSET.
+
+    Returns (products, next_cursor); next_cursor is None on the last page.
+    """
+    page_size = page_size or settings.PRODUCTS_PER_PAGE
+    queryset = queryset.select_related('category').only(*PRODUCT_CARD_FIELDS).order_by('title', 'id')
+    position = decode_cursor(after) if after else None
+    if position:
+        title, pk = position
+        queryset = queryset.filter(Q(title__gt=title) | Q(title=title, id__gt=pk))
+    # One extra row tells us whether there is a next page
+    products = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(products) > page_size:
+        products = products[:page_size]
+        next_cursor = encode_cursor(products[-1])
+    return products, next_cursor
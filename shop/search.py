@@ -0,0 +1,116 @@
+"""Full-text product search over title and description.
+
+SQLite keeps an FTS5 table (shop_product_fts, rowid = product id) in sync with
+Product; PostgreSQL matches a weighted SearchVector served by a GIN expression
+index. Other databases fall back to icontains.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .pagination import PRODUCT_CARD_FIELDS
+
+FTS_TABLE = 'shop_product_fts'
+# bm25 column weights: a title hit counts ten times a description hit
+FTS_WEIGHTS = (10.0, 1.0)
+MAX_TERMS = 8
+
+
+def search_terms(query):
+    """Lowercased word tokens; punctuation is dropped so user input cannot inject query syntax"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def fts5_query(terms):
+    # Every term must match, each as a prefix: "djan"* "begin"*
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_vector():
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector('title', weight='A', config='english') + SearchVector('description', weight='B', config='english')
+
+
+def ranked_ids(queryset, terms, limit, offset=0):
+    """Ids of the products in `queryset` matching all terms, best match first"""
+    if connection.vendor == 'sqlite':
+        # MATCH drives the query; each hit is checked against the queryset's filters by primary key.
+        # (rowid IN (<queryset>) would make SQLite probe the FTS table once per candidate instead.)
+        candidates = queryset.order_by().filter(pk=RawSQL(f'{FTS_TABLE}.rowid', ())).values('pk')
+        candidates, params = candidates.query.sql_with_params()
+        sql = (
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND EXISTS ({candidates}) '
+            f'ORDER BY bm25({FTS_TABLE}, %s, %s), rowid LIMIT %s OFFSET %s'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [fts5_query(terms), *params, *FTS_WEIGHTS, limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        search_query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config='english')
+        matches = (
+            queryset.annotate(search=search_vector()).filter(search=search_query)
+            .annotate(search_rank=SearchRank(search_vector(), search_query)).order_by('-search_rank', 'id')
+        )
+        return list(matches.values_list('pk', flat=True)[offset:offset + limit])
+
+    matches = queryset
+    for term in terms:
+        matches = matches.filter(Q(title__icontains=term) | Q(description__icontains=term))
+    return list(matches.order_by('title', 'id').values_list('pk', flat=True)[offset:offset + limit])
+
+
+def search_page(queryset, query, after=None, page_size=None):
+    """One page of product cards matching `query`, ranked by relevance.
+
+    Relevance has no stable keyset, so the cursor is the offset into the ranking.
+    Returns (products, next_cursor) like pagination.product_page.
+    """
+    page_size = page_size or settings.PRODUCTS_PER_PAGE
+    terms = search_terms(query)
+    if not terms:
+        return [], None
+    offset = int(after) if after and after.isdigit() else 0
+    ids = ranked_ids(queryset, terms, page_size + 1, offset)
+    next_cursor = str(offset + page_size) if len(ids) > page_size else None
+    ids = ids[:page_size]
+    products = queryset.select_related('category').only(*PRODUCT_CARD_FIELDS).in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products], next_cursor
+
+
+def index_product(product):
+    """Refresh one product's FTS row; PostgreSQL indexes the table's own columns"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description) VALUES (%s, %s, %s)',
+            [product.pk, product.title, product.description],
+        )
+
+
+def unindex_product(product_id):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+
+def rebuild_index():
+    """Reindex every product in one INSERT ... SELECT; returns the number of indexed rows"""
+    if connection.vendor != 'sqlite':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, description) SELECT id, title, description FROM shop_product'
+        )
+        count = cursor.rowcount
+        # Merge the index segments written by the bulk insert
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return count
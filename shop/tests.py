@@ -1,6 +1,26 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import Client, TestCase, TransactionTestCase
 from django.urls import reverse
-from .models import Category, Product
+from django.utils import timezone
+from .models import Category, Product, Order, OrderItem, FastAPIItemMapping, FastAPIOutbox, InventoryHold, SyncWatermark
+from . import item_mapping
+from .fastapi_client import FastAPIClient, FastAPIResponseError, CircuitBreaker, etag_cache, idempotency_key
+from .cart import Cart
+from .inventory import InsufficientInventory, create_order_lines, with_available
+from .search import search_page
 
 class ShopTests(TestCase):
     def setUp(self):
@@ -17,3 +37,461 @@ class ShopTests(TestCase):
         self.client.post(add_url, {'quantity': 2})
         resp = self.client.get(reverse('shop:cart_detail'))
         self.assertContains(resp, 'Django for Beginners')
+
+
+class FastAPIClientTests(TestCase):
+    def test_iter_items_follows_cursors(self):
+        pages = [
+            {'items': [{'id': 1}, {'id': 2}], 'next_cursor': 'Mg=='},
+            {'items': [{'id': 3}], 'next_cursor': None},
+        ]
+        client = FastAPIClient()
+        with mock.patch.object(client, '_make_request', side_effect=pages) as request:
+            ids = [item['id'] for item in client.iter_items(limit=2)]
+        self.assertEqual(ids, [1, 2, 3])
+        request.assert_called_with('GET', '/items', params={'limit': 2, 'cursor': 'Mg=='})
+
+    def test_iter_orders_sends_only_given_filters(self):
+        client = FastAPIClient()
+        page = {'items': [{'id': 4}], 'next_cursor': None}
+        with mock.patch.object(client, '_make_request', return_value=page) as request:
+            self.assertEqual(list(client.iter_orders(status='paid', min_id=3)), [{'id': 4}])
+        request.assert_called_once_with('GET', '/orders', params={'status': 'paid', 'min_id': 3})
+
+    def test_sync_reuses_persisted_item_mapping(self):
+        cat = Category.objects.create(name='Books')
+        prod = Product.objects.create(category=cat, title='Two Scoops', price=40, inventory=5)
+        order = Order.objects.create(shipping_name='A', shipping_address1='B', shipping_city='C', shipping_postal_code='1')
+        OrderItem.objects.create(order=order, product=prod, price=40, quantity=1)
+        item_mapping.cache.clear()
+
+        client = FastAPIClient()
+        result = {'item_ids': [7], 'order_ids': [1], 'sale_id': 1}
+        with mock.patch.object(client, '_make_request', return_value=result) as request:
+            self.assertTrue(client.sync_order_to_fastapi(order))
+            item_mapping.cache.clear()
+            self.assertTrue(client.sync_order_to_fastapi(order))
+        # One round-trip per order; the second sync sends the persisted item id
+        self.assertEqual(request.call_count, 2)
+        first, second = (call.args[2] for call in request.call_args_list)
+        self.assertIsNone(first['lines'][0]['item_id'])
+        self.assertEqual(second['lines'][0]['item_id'], 7)
+        self.assertEqual(request.call_args.kwargs['idempotency_key'], idempotency_key('order', order.id))
+        self.assertEqual(second['total'], 40.0)
+        self.assertEqual(FastAPIItemMapping.objects.get(product=prod).item_id, 7)
+
+        prod.price = 45
+        prod.save()
+        self.assertFalse(FastAPIItemMapping.objects.filter(product=prod).exists())
+
+    def test_push_resends_without_item_ids_when_the_key_saw_another_body(self):
+        cat = Category.objects.create(name='Books')
+        prod = Product.objects.create(category=cat, title='Two Scoops', price=40, inventory=5)
+        order = Order.objects.create(shipping_name='A', shipping_address1='B', shipping_city='C', shipping_postal_code='1')
+        OrderItem.objects.create(order=order, product=prod, price=40, quantity=1)
+        item_mapping.store(prod, 7)
+
+        sent = []
+
+        def request(method, endpoint, data, **kwargs):
+            sent.append([line['item_id'] for line in data['lines']])
+            if len(sent) == 1:
+                raise FastAPIResponseError('422 Client Error', 422)
+            return {'item_ids': [7], 'order_ids': [1], 'sale_id': 1}
+
+        client = FastAPIClient()
+        with mock.patch.object(client, '_make_request', side_effect=request):
+            client.push_order(order)
+        self.assertEqual(sent, [[7], [None]])
+
+    def test_circuit_breaker_opens_and_recovers(self):
+        breaker = CircuitBreaker(failure_threshold=2, cooldown=30)
+        with mock.patch('shop.fastapi_client.time.monotonic', return_value=100):
+            breaker.record_failure()
+            self.assertTrue(breaker.allow_request())
+            breaker.record_failure()
+            self.assertFalse(breaker.allow_request())
+        with mock.patch('shop.fastapi_client.time.monotonic', return_value=131):
+            self.assertTrue(breaker.allow_request())
+            # Only one trial call while half-open
+            self.assertFalse(breaker.allow_request())
+            breaker.record_success()
+        stats = breaker.stats()
+        self.assertEqual(stats['state'], CircuitBreaker.CLOSED)
+        self.assertEqual(stats['rejected'], 2)
+        self.assertEqual(stats['transitions'], {'closed->open': 1, 'open->half_open': 1, 'half_open->closed': 1})
+
+    def test_half_open_trial_reopens_on_any_error(self):
+        client = FastAPIClient()
+        client.breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+        client.breaker.record_failure()
+        with mock.patch.object(client.session, 'request', side_effect=TypeError('not serializable')):
+            with self.assertRaises(TypeError):
+                client.get_items()
+        self.assertEqual(client.breaker.state, CircuitBreaker.OPEN)
+
+    def test_get_revalidates_cached_response_with_etag(self):
+        etag_cache.clear()
+        ok = mock.Mock(status_code=200, headers={'ETag': '"items-1-abc"'}, content=b'{}')
+        ok.json.return_value = {'items': [{'id': 1}], 'next_cursor': None}
+        not_modified = mock.Mock(status_code=304, headers={'ETag': '"items-1-abc"'}, content=b'')
+        client = FastAPIClient()
+        with mock.patch.object(client.session, 'request', side_effect=[ok, not_modified]) as request:
+            self.assertEqual(client.get_items(), ok.json.return_value)
+            self.assertEqual(client.get_items(), ok.json.return_value)
+        self.assertEqual(request.call_args.kwargs['headers'], {'If-None-Match': '"items-1-abc"'})
+
+    def test_export_orders_streams_ndjson_lines(self):
+        response = mock.MagicMock(status_code=200)
+        response.__enter__.return_value = response
+        response.iter_lines.return_value = iter([b'{"id":1}', b'', b'{"id":2}'])
+        client = FastAPIClient()
+        with mock.patch.object(client.session, 'get', return_value=response) as get:
+            rows = client.export_orders()
+            get.assert_not_called()
+            self.assertEqual(list(rows), [{'id': 1}, {'id': 2}])
+        get.assert_called_once_with(f'{client.base_url}/orders/export', stream=True, timeout=client.timeout)
+
+
+class ProductListingTests(TestCase):
+    def setUp(self):
+        self.cat = Category.objects.create(name='Books')
+
+    def add_products(self, count, start=0):
+        for i in range(start, start + count):
+            Product.objects.create(category=self.cat, title=f'Book {i:03}', slug=f'book-{i}', price=10, inventory=1)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_is_independent_of_catalog_size(self):
+        self.add_products(3)
+        small = [self.count_queries(url)[0] for url in (reverse('shop:home'), reverse('shop:product_list_by_category', args=[self.cat.slug]))]
+        self.add_products(80, start=3)
+        large = [self.count_queries(url)[0] for url in (reverse('shop:home'), reverse('shop:product_list_by_category', args=[self.cat.slug]))]
+        self.assertEqual(small, large)
+
+    def test_pages_follow_title_then_id(self):
+        self.add_products(30)
+        # Equal titles are ordered by id so none is skipped or repeated across pages
+        Product.objects.create(category=self.cat, title='Book 023', slug='book-23-dup', price=10, inventory=1)
+        seen = []
+        url = reverse('shop:home')
+        while url:
+            response = self.client.get(url)
+            seen += [product.pk for product in response.context['products']]
+            cursor = response.context['next_cursor']
+            url = f"{reverse('shop:home')}?after={cursor}" if cursor else None
+        self.assertEqual(seen, list(Product.objects.order_by('title', 'id').values_list('pk', flat=True)))
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.cat = Category.objects.create(name='Books')
+        self.in_title = Product.objects.create(category=self.cat, title='Django Unleashed', price=10, inventory=1)
+        self.in_description = Product.objects.create(
+            category=self.cat, title='Web Patterns', description='Examples use Django throughout', price=10, inventory=1,
+        )
+        Product.objects.create(category=self.cat, title='Flask Basics', price=10, inventory=1)
+
+    def titles(self, query):
+        return [product.title for product in search_page(Product.objects.all(), query)[0]]
+
+    def test_ranks_title_matches_first_and_matches_prefixes(self):
+        self.assertEqual(self.titles('djan'), ['Django Unleashed', 'Web Patterns'])
+        self.assertEqual(self.titles('django "unleash*'), ['Django Unleashed'])
+        self.assertEqual(self.titles('rails'), [])
+
+    def test_index_follows_save_delete_and_rebuild(self):
+        self.in_title.title = 'Pyramid Unleashed'
+        self.in_title.save()
+        self.assertEqual(self.titles('pyramid'), ['Pyramid Unleashed'])
+        self.assertEqual(self.titles('django'), ['Web Patterns'])
+        self.in_description.delete()
+        self.assertEqual(self.titles('django'), [])
+        Product.objects.filter(pk=self.in_title.pk).update(title='Renamed Behind The Index')
+        call_command('rebuild_search_index', stdout=mock.Mock())
+        self.assertEqual(self.titles('behind'), ['Renamed Behind The Index'])
+
+    def test_loaddata_indexes_products(self):
+        fixture = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'products.json')
+        with open(fixture, 'w') as f:
+            json.dump([{'model': 'shop.product', 'pk': 100, 'fields': {
+                'category': self.cat.pk, 'title': 'Loaded Django', 'slug': 'loaded-django', 'price': '5.00',
+            }}], f)
+        call_command('loaddata', fixture, verbosity=0)
+        self.assertEqual(self.titles('loaded'), ['Loaded Django'])
+
+    def test_saves_of_other_fields_skip_the_index_and_mapping(self):
+        self.in_title.inventory = 3
+        with CaptureQueriesContext(connection) as queries:
+            self.in_title.save(update_fields=['inventory'])
+        self.assertEqual(len(queries), 1)
+        self.in_title.description = 'Now about Flask'
+        self.in_title.save(update_fields=['description'])
+        self.assertEqual(self.titles('flask'), ['Flask Basics', 'Django Unleashed'])
+
+    def test_product_list_uses_search(self):
+        response = self.client.get(reverse('shop:product_list_by_category', args=[self.cat.slug]), {'q': 'django'})
+        self.assertEqual([p.title for p in response.context['products']], ['Django Unleashed', 'Web Patterns'])
+
+
+class CheckoutInventoryTests(TransactionTestCase):
+    BUYERS = 20
+    STOCK = 5
+
+    def setUp(self):
+        cat = Category.objects.create(name='Books')
+        self.prod = Product.objects.create(category=cat, title='Last Copies', price=10, inventory=self.STOCK)
+
+    def buy(self, results):
+        """Check out one unit through the view, the way a browser would"""
+        try:
+            client = Client()
+            session = client.session
+            session['cart'] = {str(self.prod.id): {'quantity': 1, 'price': '10', 'title': self.prod.title}}
+            session.save()
+            client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+            response = client.post(reverse('shop:checkout'), {
+                'name': 'Juan', 'email': 'juan@example.com', 'address1': '1 Street',
+                'city': 'Manila', 'postal_code': '1000', 'country': 'Philippines',
+            })
+            results.append(response.url)
+        except Exception as e:
+            results.append(e)
+        finally:
+            connection.close()
+
+    def test_concurrent_checkouts_never_oversell(self):
+        results = []
+        threads = [threading.Thread(target=self.buy, args=(results,)) for _ in range(self.BUYERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.prod.refresh_from_db()
+        # No errors: every buyer is redirected to their order, or back to the cart on a stock-out
+        orders = [reverse('shop:order_success', args=[order.id]) for order in Order.objects.all()]
+        self.maxDiff = None
+        self.assertCountEqual(results, orders + [reverse('shop:cart_detail')] * (self.BUYERS - self.STOCK))
+        self.assertEqual(self.prod.inventory, 0)
+        self.assertEqual(OrderItem.objects.count(), self.STOCK)
+        # Stock-outs roll back their order too
+        self.assertEqual(Order.objects.count(), self.STOCK)
+
+    def test_short_line_rolls_back_the_whole_order(self):
+        other = Product.objects.create(category=self.prod.category, title='Plenty', price=5, inventory=100)
+        with self.assertRaises(InsufficientInventory):
+            with transaction.atomic():
+                order = Order.objects.create(shipping_name='A', shipping_address1='B', shipping_city='C', shipping_postal_code='1')
+                create_order_lines(order, [(other, other.price, 3), (self.prod, self.prod.price, self.STOCK + 1)])
+        other.refresh_from_db()
+        self.assertEqual(other.inventory, 100)
+        self.assertFalse(OrderItem.objects.exists())
+
+
+class InventoryHoldTests(TestCase):
+    def setUp(self):
+        cat = Category.objects.create(name='Books')
+        self.prod = Product.objects.create(category=cat, title='Limited Run', price=10, inventory=3)
+
+    def cart(self):
+        return Cart(SimpleNamespace(session=SessionStore()))
+
+    def available(self, hold_key=None):
+        return with_available(Product.objects.filter(pk=self.prod.pk), hold_key).get().available
+
+    def test_add_holds_units_against_other_carts(self):
+        first, second = self.cart(), self.cart()
+        first.add(self.prod.id, 2)
+        self.assertEqual(self.available(), 1)
+        self.assertEqual(self.available(first.hold_key), 3)
+        with self.assertRaises(InsufficientInventory):
+            second.add(self.prod.id, 2)
+        self.assertEqual(len(second), 0)
+        # Changing the quantity replaces the cart's hold rather than adding to it
+        first.add(self.prod.id, 3, update_quantity=True)
+        self.assertEqual(InventoryHold.objects.get().quantity, 3)
+        first.remove(self.prod.id)
+        self.assertEqual(self.available(), 3)
+
+    def test_checkout_converts_holds_and_respects_others(self):
+        holder, other = self.cart(), self.cart()
+        holder.add(self.prod.id, 2)
+        order = Order.objects.create(shipping_name='A', shipping_address1='B', shipping_city='C', shipping_postal_code='1')
+        with self.assertRaises(InsufficientInventory):
+            create_order_lines(order, [(self.prod, self.prod.price, 2)], hold_key=other.hold_key)
+        create_order_lines(order, [(self.prod, self.prod.price, 2)], hold_key=holder.hold_key)
+        self.prod.refresh_from_db()
+        self.assertEqual(self.prod.inventory, 1)
+        self.assertFalse(InventoryHold.objects.exists())
+
+    def test_expired_holds_free_stock_and_are_swept(self):
+        self.cart().add(self.prod.id, 3)
+        InventoryHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.available(), 3)
+        call_command('expire_holds', '--once', stdout=mock.Mock())
+        self.assertFalse(InventoryHold.objects.exists())
+
+
+class ConcurrentHoldTests(TransactionTestCase):
+    SHOPPERS = 20
+    STOCK = 5
+
+    def setUp(self):
+        cat = Category.objects.create(name='Books')
+        self.prod = Product.objects.create(category=cat, title='Limited Run', price=10, inventory=self.STOCK)
+
+    def add_to_cart(self, results):
+        try:
+            response = Client().post(reverse('cart:cart_add'), {'action': 'post', 'product_id': self.prod.id, 'quantity': 1})
+            results.append(response.status_code)
+        except Exception as e:
+            results.append(e)
+        finally:
+            connection.close()
+
+    def test_concurrent_adds_never_hold_more_than_stock(self):
+        results = []
+        threads = [threading.Thread(target=self.add_to_cart, args=(results,)) for _ in range(self.SHOPPERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Every add either holds a unit or is refused with a 409, never a locking error
+        self.assertCountEqual(results, [200] * self.STOCK + [409] * (self.SHOPPERS - self.STOCK))
+        self.assertEqual(InventoryHold.objects.count(), self.STOCK)
+
+
+class OrderTotalTests(TestCase):
+    def setUp(self):
+        cat = Category.objects.create(name='Books')
+        self.prod = Product.objects.create(category=cat, title='Two Scoops', price=40, inventory=50)
+
+    def order(self, quantity=1):
+        order = Order.objects.create(shipping_name='A', shipping_address1='B', shipping_city='C', shipping_postal_code='1')
+        OrderItem.objects.create(order=order, product=self.prod, price=40, quantity=quantity)
+        return order
+
+    def test_total_follows_line_writes_and_backfill(self):
+        order = self.order(quantity=2)
+        order.refresh_from_db()
+        self.assertEqual(order.total, 80)
+        line = OrderItem.objects.create(order=order, product=self.prod, price=5, quantity=1)
+        line.delete()
+        Order.objects.update(total=0)
+        call_command('backfill_order_totals', stdout=mock.Mock())
+        order.refresh_from_db()
+        self.assertEqual(order.total, 80)
+        self.assertEqual(Order.objects.with_line_total().get().line_total, 80)
+
+    def test_admin_changelist_query_count_does_not_grow_with_orders(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        url = reverse('admin:shop_order_changelist')
+        self.order()
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for _ in range(5):
+            self.order()
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(few), len(many))
+
+
+class FastAPIOutboxTests(TestCase):
+    def setUp(self):
+        self.cat = Category.objects.create(name='Books')
+        self.prod = Product.objects.create(category=self.cat, title='Django for Beginners', price=500, inventory=5)
+
+    def checkout(self):
+        session = self.client.session
+        session['cart'] = {str(self.prod.id): {'quantity': 2, 'price': '500', 'title': self.prod.title}}
+        session.save()
+        return self.client.post(reverse('shop:checkout'), {
+            'name': 'Juan', 'email': 'juan@example.com', 'address1': '1 Street',
+            'city': 'Manila', 'postal_code': '1000', 'country': 'Philippines',
+        })
+
+    def test_checkout_queues_sync_without_calling_fastapi(self):
+        with mock.patch('shop.fastapi_client.FastAPIClient._make_request') as request:
+            self.checkout()
+        request.assert_not_called()
+        outbox = FastAPIOutbox.objects.get()
+        self.assertEqual(outbox.status, FastAPIOutbox.STATUS_PENDING)
+
+    def test_run_outbox_marks_rows_done(self):
+        self.checkout()
+        with mock.patch('shop.fastapi_client.FastAPIClient.push_order') as push:
+            call_command('run_outbox', '--once', stdout=mock.Mock())
+        push.assert_called_once()
+        self.assertEqual(FastAPIOutbox.objects.get().status, FastAPIOutbox.STATUS_DONE)
+
+    def test_run_outbox_backs_off_on_failure(self):
+        self.checkout()
+        with mock.patch('shop.fastapi_client.FastAPIClient.push_order', side_effect=Exception('down')):
+            call_command('run_outbox', '--once', stdout=mock.Mock())
+        outbox = FastAPIOutbox.objects.get()
+        self.assertEqual(outbox.status, FastAPIOutbox.STATUS_PENDING)
+        self.assertEqual(outbox.attempts, 1)
+        self.assertEqual(outbox.last_error, 'down')
+
+    def test_run_outbox_pushes_each_order_with_its_own_key(self):
+        self.checkout()
+        self.checkout()
+        bad, good = FastAPIOutbox.objects.order_by('id')
+        keys = []
+        bad_key = idempotency_key('order', bad.order_id)
+
+        def request(method, endpoint, data=None, **kwargs):
+            keys.append(kwargs['idempotency_key'])
+            if kwargs['idempotency_key'] == bad_key:
+                raise Exception('rejected')
+            return {'item_ids': [1], 'order_ids': [1]}
+
+        with mock.patch('shop.fastapi_client.FastAPIClient._make_request', side_effect=request):
+            call_command('run_outbox', '--once', stdout=mock.Mock())
+        self.assertEqual(keys, [idempotency_key('order', row.order_id) for row in (bad, good)])
+        bad.refresh_from_db()
+        good.refresh_from_db()
+        self.assertEqual((bad.status, bad.attempts), (FastAPIOutbox.STATUS_PENDING, 1))
+        self.assertEqual(good.status, FastAPIOutbox.STATUS_DONE)
+
+
+class SyncToFastAPICommandTests(TestCase):
+    def setUp(self):
+        cat = Category.objects.create(name='Books')
+        prod = Product.objects.create(category=cat, title='Django for Beginners', price=500, inventory=5)
+        for _ in range(3):
+            order = Order.objects.create(shipping_name='A', shipping_address1='B', shipping_city='C', shipping_postal_code='1')
+            OrderItem.objects.create(order=order, product=prod, price=500, quantity=1)
+
+    def test_incremental_sync_skips_already_synced_orders(self):
+        with mock.patch('shop.fastapi_client.FastAPIClient.sync_order_to_fastapi', return_value=True) as sync:
+            call_command('sync_to_fastapi', '--incremental', '--workers', '2', '--chunk-size', '2', stdout=mock.Mock())
+            self.assertEqual(sync.call_count, 3)
+            call_command('sync_to_fastapi', '--incremental', stdout=mock.Mock())
+            self.assertEqual(sync.call_count, 3)
+        self.assertEqual(SyncWatermark.objects.get().value, Order.objects.latest('updated').updated)
+
+    def test_sync_skips_orders_pushed_by_outbox_or_changed_after_sync(self):
+        first, second, third = Order.objects.order_by('id')
+        FastAPIOutbox.objects.create(order=first)
+        FastAPIOutbox.objects.create(order=second)
+        with mock.patch('shop.fastapi_client.FastAPIClient.push_order') as push:
+            call_command('run_outbox', '--once', stdout=mock.Mock())
+        self.assertEqual(push.call_count, 2)
+        with mock.patch('shop.fastapi_client.FastAPIClient.sync_order_to_fastapi', return_value=True) as sync:
+            call_command('sync_to_fastapi', '--incremental', stdout=mock.Mock())
+            self.assertEqual([call.args[0] for call in sync.call_args_list], [third])
+            third.refresh_from_db()
+            third.status = 'shipped'
+            third.save()
+            call_command('sync_to_fastapi', '--incremental', stdout=mock.Mock())
+            call_command('sync_to_fastapi', '--all', stdout=mock.Mock())
+            self.assertEqual(sync.call_count, 1)
+        self.assertFalse(Order.objects.filter(fastapi_synced_at__isnull=True).exists())
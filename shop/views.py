@@ -6,9 +6,12 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import authenticate, login, logout
 from django import forms
 from django.http import HttpResponse
-from .models import Category, Product, Order, OrderItem
+from .models import Category, Product, Order, OrderItem, FastAPIOutbox
 from .forms import SignUpForm, AddToCartForm, CheckoutForm
 from .cart import Cart
+from .inventory import InsufficientInventory, create_order_lines
+from .pagination import product_page
+from .search import search_page
 from .fastapi_client import FastAPIClient
 import logging
 
@@ -19,8 +22,9 @@ def product(request,pk):
     return render(request, "product.html", {"products": products})
 
 def home(request):
-    products = Product.objects.all()
-    return render(request, "home.html", {"products": products})
+    after = request.GET.get('after')
+    products, next_cursor = product_page(Product.objects.all(), after)
+    return render(request, "home.html", {"products": products, "next_cursor": next_cursor, "after": after})
 
 def about(request):
     return render(request, 'about.html')
@@ -72,9 +76,15 @@ def product_list(request, slug=None):
     if slug:
         category = get_object_or_404(Category, slug=slug)
         products = products.filter(category=category)
+    after = request.GET.get('after')
     if query:
-        products = products.filter(title__icontains=query)
-    context = {'categories': categories, 'products': products, 'category': category, 'query': query or ''}
+        products, next_cursor = search_page(products, query, after)
+    else:
+        products, next_cursor = product_page(products, after)
+    context = {
+        'categories': categories, 'products': products, 'category': category, 'query': query or '',
+        'next_cursor': next_cursor, 'after': after,
+    }
     return render(request, 'shop/product_list.html', context)
 
 def product_detail(request, pk):
@@ -89,14 +99,22 @@ def cart_detail(request):
 def cart_add(request, product_id):
     cart = Cart(request)
     qty = int(request.POST.get('quantity', 1))
-    cart.add(product_id, qty)
+    try:
+        cart.add(product_id, qty)
+    except InsufficientInventory as e:
+        messages.error(request, str(e))
+        return redirect('shop:cart_detail')
     messages.success(request, 'Item added to cart.')
     return redirect('shop:cart_detail')
 
 def cart_update(request, product_id):
     cart = Cart(request)
     qty = int(request.POST.get('quantity', 1))
-    cart.add(product_id, qty, update_quantity=True)
+    try:
+        cart.add(product_id, qty, update_quantity=True)
+    except InsufficientInventory as e:
+        messages.error(request, str(e))
+        return redirect('shop:cart_detail')
     messages.success(request, 'Cart updated.')
     return redirect('shop:cart_detail')
 
@@ -130,28 +148,18 @@ def checkout(request):
                 paid=False,
                 status='new'
             )
-            # create order items and reduce inventory
-            for item in cart:
-                if item['quantity'] > item['product'].inventory:
-                    transaction.set_rollback(True)
-                    messages.error(request, f"Insufficient inventory for {item['product'].title}. Available: {item['product'].inventory}")
-                    return redirect('shop:cart_detail')
-                OrderItem.objects.create(order=order, product=item['product'], price=item['price'], quantity=item['quantity'])
-                item['product'].inventory -= item['quantity']
-                item['product'].save()
-            
-            # Sync order to FastAPI
+            # create order items and reduce inventory with conditional UPDATEs, converting the cart's holds
             try:
-                fastapi_client = FastAPIClient()
-                sync_success = fastapi_client.sync_order_to_fastapi(order)
-                if sync_success:
-                    logger.info(f"Order {order.id} successfully synced to FastAPI")
-                else:
-                    logger.warning(f"Failed to sync order {order.id} to FastAPI, but order was created in Django")
-            except Exception as e:
-                logger.error(f"Error syncing order {order.id} to FastAPI: {e}")
-                # Don't fail the order creation if FastAPI sync fails
-                pass
+                create_order_lines(
+                    order, [(item['product'], item['price'], item['quantity']) for item in cart], hold_key=cart.hold_key
+                )
+            except InsufficientInventory as e:
+                transaction.set_rollback(True)
+                messages.error(request, str(e))
+                return redirect('shop:cart_detail')
+            
+            # Queue the FastAPI sync in the same transaction; `manage.py run_outbox` pushes it
+            FastAPIOutbox.objects.create(order=order)
             
             cart.clear()
             messages.success(request, 'Order placed successfully.')
@@ -175,13 +183,12 @@ def test_fastapi_connection(request):
         messages.error(request, 'Access denied. Admin only.')
         return redirect('shop:product_list')
     
+    fastapi_client = FastAPIClient()
     try:
-        fastapi_client = FastAPIClient()
-        
-        # Test connection and get data
-        items = fastapi_client.get_items()
-        orders = fastapi_client.get_orders()
-        sales = fastapi_client.get_sales()
+        # Test connection and get the first page of each list
+        items = fastapi_client.get_items()['items']
+        orders = fastapi_client.get_orders()['items']
+        sales = fastapi_client.get_sales()['items']
         
         context = {
             'items': items,
@@ -201,4 +208,6 @@ def test_fastapi_connection(request):
         }
         messages.error(request, f'Failed to connect to FastAPI: {str(e)}')
     
+    context['breaker'] = fastapi_client.breaker.stats()
+    
     return render(request, 'shop/fastapi_test.html', context)
@@ -0,0 +1,328 @@
+"""Tests for the FastAPI service in main.py.
+
+Run with `python -m pytest test_api.py` or `python -m unittest test_api`. The app
+is pointed at a throwaway SQLite file before it is imported; set TEST_DATABASE_URL
+(e.g. sqlite+aiosqlite:////tmp/api.db) to run the same tests in async mode.
+"""
+import os
+import tempfile
+from datetime import datetime, timedelta
+import unittest
+from unittest import mock
+
+os.environ["DATABASE_URL"] = os.getenv(
+    "TEST_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test_api.db')}"
+)
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import idempotency
+import main
+import models
+from analytics import rollup_sales
+from cache import ResponseCache, bump_generation
+from database import Base, DATABASE_URL_INFO
+
+# Rows are wiped between tests over a plain sync connection, which works in both modes.
+# Generations only ever move forward, so cache_generations is bumped rather than wiped.
+reset_engine = create_engine(DATABASE_URL_INFO.set(drivername=DATABASE_URL_INFO.get_backend_name()))
+
+
+class APITestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(main.app)
+        self.client.__enter__()
+        with reset_engine.begin() as conn:
+            for table in reversed(Base.metadata.sorted_tables):
+                if table.name != models.CacheGeneration.__tablename__:
+                    conn.execute(table.delete())
+            generations = models.CacheGeneration.__table__
+            conn.execute(generations.update().values(generation=generations.c.generation + 1))
+        self.addCleanup(self.client.__exit__, None, None, None)
+
+    def post(self, path, json, **kwargs):
+        response = self.client.post(path, json=json, **kwargs)
+        self.assertEqual(response.status_code, 200, response.text)
+        return response.json()
+
+    def create_items(self, count):
+        return self.post("/items/bulk", [{"name": f"item {i}", "price": i + 1.0} for i in range(count)])["ids"]
+
+
+class IdempotencyTests(APITestCase):
+    def post_with_key(self, path, json, key="key-1"):
+        return self.client.post(path, json=json, headers={"Idempotency-Key": key})
+
+    def reserve(self, key, age_seconds):
+        """A key left unfinished by a request that started `age_seconds` ago"""
+        with reset_engine.begin() as conn:
+            conn.execute(models.IdempotencyKey.__table__.insert().values(
+                key=key, path="/items", created_at=datetime.utcnow() - timedelta(seconds=age_seconds),
+            ))
+
+    def test_repeated_key_replays_the_first_response(self):
+        first = self.post_with_key("/items", {"name": "pen", "price": 1.0})
+        second = self.post_with_key("/items", {"name": "pen", "price": 1.0})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(len(self.client.get("/items").json()["items"]), 1)
+
+    def test_key_reused_on_another_path_or_body_is_a_422(self):
+        item = self.post_with_key("/items", {"name": "pen", "price": 1.0}).json()
+        other_path = self.post_with_key("/orders", {"item_id": item["id"], "quantity": 1})
+        other_body = self.post_with_key("/items", {"name": "pen", "price": 2.0})
+        self.assertEqual((other_path.status_code, other_body.status_code), (422, 422))
+        self.assertEqual(len(self.client.get("/items").json()["items"]), 1)
+
+    def test_unfinished_key_is_in_progress_until_its_lease_runs_out(self):
+        self.reserve("fresh", age_seconds=1)
+        self.assertEqual(self.post_with_key("/items", {"name": "pen", "price": 1.0}, key="fresh").status_code, 409)
+        self.reserve("abandoned", age_seconds=idempotency.IDEMPOTENCY_LOCK_SECONDS + 1)
+        retried = self.post_with_key("/items", {"name": "pen", "price": 1.0}, key="abandoned")
+        self.assertEqual(retried.status_code, 200)
+        self.assertEqual(self.post_with_key("/items", {"name": "pen", "price": 1.0}, key="abandoned").json(), retried.json())
+
+    def test_failed_request_releases_its_key(self):
+        self.post("/items", {"name": "pen", "price": 1.0})
+        self.assertEqual(self.post_with_key("/items", {"name": "pen", "price": 1.0}).status_code, 409)
+        with reset_engine.connect() as conn:
+            self.assertEqual(conn.execute(models.IdempotencyKey.__table__.select()).all(), [])
+        self.client.post("/items/bulk-delete", json={"ids": [item["id"] for item in self.client.get("/items").json()["items"]]})
+        self.assertEqual(self.post_with_key("/items", {"name": "pen", "price": 1.0}).status_code, 200)
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def test_stale_generation_neither_reads_nor_writes(self):
+        cache = ResponseCache(ttl=60)
+        cache.set("page", b"old", generation=1)
+        self.assertIsNone(cache.get("page", generation=2))
+        # A request that read generation 1 finishes after one that read 2
+        cache.set("page", b"old", generation=1)
+        self.assertIsNone(cache.get("page", generation=2))
+        self.assertIsNone(cache.get("page", generation=1))
+        self.assertEqual(cache.stats()["generation"], 2)
+        cache.set("page", b"new", generation=2)
+        self.assertEqual(cache.get("page", generation=2), b"new")
+
+
+class PaginationTests(APITestCase):
+    def test_pages_follow_the_keyset_cursor(self):
+        ids = self.create_items(5)
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            page = self.client.get("/items", params=params).json()
+            seen += [item["id"] for item in page["items"]]
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, ids)
+
+    def test_invalid_cursor_is_a_400(self):
+        response = self.client.get("/items", params={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["detail"], "Invalid cursor")
+
+
+class BulkInsertTests(APITestCase):
+    def test_ids_come_back_in_input_order(self):
+        ids = self.create_items(3)
+        items = self.client.get("/items").json()["items"]
+        self.assertEqual([(item["id"], item["name"]) for item in items], list(zip(ids, ["item 0", "item 1", "item 2"])))
+
+    def test_oversized_batch_is_a_413_and_inserts_nothing(self):
+        with mock.patch.object(main, "MAX_BULK_SIZE", 2):
+            response = self.client.post("/items/bulk", json=[{"name": f"x{i}", "price": 1} for i in range(3)])
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.client.get("/items").json()["items"], [])
+
+
+class ItemKeyTests(APITestCase):
+    def test_by_key_gets_or_creates(self):
+        created = self.client.put("/items/by-key", json={"name": "pen", "price": 2.5}).json()
+        found = self.client.put("/items/by-key", json={"name": "pen", "price": 2.5}).json()
+        self.assertEqual(created, found)
+        self.assertEqual(len(self.client.get("/items").json()["items"]), 1)
+
+    def test_duplicate_create_is_a_409(self):
+        self.post("/items", {"name": "pen", "price": 2.5})
+        response = self.client.post("/items", json={"name": "pen", "price": 2.5})
+        self.assertEqual(response.status_code, 409)
+
+
+class CompositeOrderTests(APITestCase):
+    def composite(self):
+        return self.post("/orders/composite", {
+            "lines": [
+                {"name": "pen", "price": 2.5, "quantity": 2},
+                {"name": "ink", "price": 4.0, "quantity": 1, "item_id": self.ink},
+            ],
+            "status": "paid",
+            "total": 9.0,
+        })
+
+    def setUp(self):
+        super().setUp()
+        self.ink = self.post("/items", {"name": "ink", "price": 4.0})["id"]
+
+    def test_resolves_given_ids_and_creates_missing_items(self):
+        result = self.composite()
+        pen = self.client.put("/items/by-key", json={"name": "pen", "price": 2.5}).json()["id"]
+        self.assertEqual(result["item_ids"], [pen, self.ink])
+        orders = self.client.get("/orders").json()["items"]
+        self.assertEqual([(o["id"], o["item_id"], o["quantity"]) for o in orders],
+                         list(zip(result["order_ids"], [pen, self.ink], [2, 1])))
+        sale = self.client.get("/sales").json()["items"][0]
+        self.assertEqual((sale["id"], sale["order_id"], sale["total"]), (result["sale_id"], result["order_ids"][0], 9.0))
+
+    def test_retries_once_after_losing_an_item_insert_race(self):
+        resolve_items = main.resolve_items
+        calls = []
+
+        def racing(db, lines):
+            calls.append(lines)
+            if len(calls) == 1:
+                raise IntegrityError("INSERT INTO items", {}, Exception("UNIQUE constraint failed"))
+            return resolve_items(db, lines)
+
+        with mock.patch.object(main, "resolve_items", side_effect=racing):
+            result = self.composite()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(self.client.get("/orders").json()["items"]), len(result["order_ids"]))
+
+
+class OrderFilterTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.pen, self.ink = self.create_items(2)
+        self.orders = self.post("/orders/bulk", [
+            {"item_id": self.pen, "quantity": 1, "status": "paid"},
+            {"item_id": self.ink, "quantity": 1, "status": "pending"},
+            {"item_id": self.pen, "quantity": 2, "status": "pending"},
+            {"item_id": self.pen, "quantity": 3, "status": "paid"},
+        ])["ids"]
+
+    def order_ids(self, **params):
+        return [order["id"] for order in self.client.get("/orders", params=params).json()["items"]]
+
+    def test_filters_combine(self):
+        first, second, third, fourth = self.orders
+        self.assertEqual(self.order_ids(status="paid"), [first, fourth])
+        self.assertEqual(self.order_ids(item_id=self.pen), [first, third, fourth])
+        self.assertEqual(self.order_ids(item_id=self.pen, status="pending"), [third])
+        self.assertEqual(self.order_ids(min_id=second, max_id=third), [second, third])
+
+    def test_filtered_pages_follow_the_cursor(self):
+        page = self.client.get("/orders", params={"item_id": self.pen, "limit": 2}).json()
+        rest = self.client.get("/orders", params={"item_id": self.pen, "limit": 2, "cursor": page["next_cursor"]}).json()
+        self.assertEqual([o["id"] for o in page["items"] + rest["items"]], [self.orders[0], self.orders[2], self.orders[3]])
+        self.assertIsNone(rest["next_cursor"])
+
+    def test_expand_embeds_the_item(self):
+        orders = self.client.get("/orders", params={"expand": "item", "status": "pending"}).json()["items"]
+        self.assertEqual([order["item"]["id"] for order in orders], [self.ink, self.pen])
+        self.assertEqual(orders[0]["item"]["name"], "item 1")
+        self.assertNotIn("item", self.client.get("/orders").json()["items"][0])
+
+
+class SalesSummaryTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.pen, self.ink = self.create_items(2)
+        self.orders = self.post("/orders/bulk", [
+            {"item_id": self.pen, "quantity": 1, "status": "paid"},
+            {"item_id": self.ink, "quantity": 2, "status": "pending"},
+        ])["ids"]
+
+    def assert_sources_agree(self, **params):
+        rollup = self.client.get("/sales/summary", params=params).json()
+        live = self.client.get("/sales/summary", params={**params, "source": "live"}).json()
+        self.assertEqual((rollup["by_item"], rollup["by_status"]), (live["by_item"], live["by_status"]))
+        return rollup
+
+    def assert_sources_agree_today(self):
+        self.assert_sources_agree()
+        return self.assert_sources_agree(since=datetime.utcnow().date().isoformat())
+
+    def test_rollups_follow_every_write(self):
+        self.post("/sales", {"order_id": self.orders[0], "total": 2.0})
+        self.assert_sources_agree_today()
+        self.post("/sales/bulk", [{"order_id": self.orders[1], "total": 4.0}, {"order_id": self.orders[0], "total": 1.5}])
+        self.assert_sources_agree_today()
+        self.post("/orders/composite", {"lines": [{"name": "cap", "price": 3.0, "quantity": 1}], "status": "paid", "total": 3.0})
+        self.assert_sources_agree_today()
+        self.assertEqual(self.client.patch("/orders/status", json={"status": "shipped", "ids": self.orders}).status_code, 200)
+        self.assert_sources_agree_today()
+        self.assertEqual(self.client.delete(f"/orders/{self.orders[0]}").status_code, 200)
+        summary = self.assert_sources_agree_today()
+        self.assertEqual([(row["status"], row["count"], row["total"]) for row in summary["by_status"]],
+                         [("paid", 1, 3.0), ("shipped", 1, 4.0)])
+
+    def test_range_starting_mid_week_cuts_at_the_day(self):
+        tuesday, thursday = datetime(2024, 1, 2, 12), datetime(2024, 1, 4, 12)
+        with Session(reset_engine) as db:
+            sales = [models.Sale(order_id=self.orders[0], total=total, created_at=moment)
+                     for moment, total in [(tuesday, 2.0), (thursday, 5.0)]]
+            db.add_all(sales)
+            db.flush()
+            rollup_sales(db, [sale.id for sale in sales])
+            bump_generation(db, "sales")
+            db.commit()
+        summary = self.assert_sources_agree(since="2024-01-03", until="2024-01-07")
+        self.assertEqual([(row["count"], row["total"]) for row in summary["by_status"]], [(1, 5.0)])
+        self.assertEqual(self.assert_sources_agree(until="2024-01-02")["by_status"][0]["total"], 2.0)
+
+
+class ExportTests(APITestCase):
+    def test_export_varies_on_accept_encoding(self):
+        self.create_items(2)
+        self.post("/orders", {"item_id": self.client.get("/items").json()["items"][0]["id"], "quantity": 1})
+        for encoding, content_encoding in [("gzip", "gzip"), ("identity", None)]:
+            response = self.client.get("/orders/export", headers={"Accept-Encoding": encoding})
+            self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+            self.assertEqual(response.headers.get("Content-Encoding"), content_encoding)
+            self.assertEqual(len(response.text.splitlines()), 1)
+
+
+class BulkUpdateTests(APITestCase):
+    def test_patch_items_counts_existing_rows(self):
+        pen, ink = self.create_items(2)
+        response = self.client.patch("/items/bulk", json=[
+            {"id": pen, "price": 9.0}, {"id": ink, "name": "ink", "price": 3.0}, {"id": 999, "price": 1.0},
+        ])
+        self.assertEqual(response.json(), {"updated": 2})
+        items = {item["id"]: item for item in self.client.get("/items").json()["items"]}
+        self.assertEqual((items[pen]["name"], items[pen]["price"]), ("item 0", 9.0))
+        self.assertEqual((items[ink]["name"], items[ink]["price"]), ("ink", 3.0))
+
+    def test_order_status_counts_only_changed_orders(self):
+        pen, ink = self.create_items(2)
+        first, second, third = self.post("/orders/bulk", [
+            {"item_id": pen, "quantity": 1, "status": "pending"},
+            {"item_id": ink, "quantity": 1, "status": "pending"},
+            {"item_id": pen, "quantity": 1, "status": "shipped"},
+        ])["ids"]
+        update = lambda body: self.client.patch("/orders/status", json=body).json()
+        self.assertEqual(update({"status": "shipped", "where": {"item_id": pen}}), {"updated": 1})
+        self.assertEqual(update({"status": "cancelled", "ids": [second, 999]}), {"updated": 1})
+        self.assertEqual(update({"status": "cancelled", "ids": [second]}), {"updated": 0})
+        statuses = {o["id"]: o["status"] for o in self.client.get("/orders").json()["items"]}
+        self.assertEqual(statuses, {first: "shipped", second: "cancelled", third: "shipped"})
+
+    def test_order_status_without_a_selector_is_a_400(self):
+        response = self.client.patch("/orders/status", json={"status": "shipped"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_delete_counts_existing_rows(self):
+        pen, ink, cap = self.create_items(3)
+        response = self.client.post("/items/bulk-delete", json={"ids": [pen, cap, 999]})
+        self.assertEqual(response.json(), {"deleted": 2})
+        self.assertEqual([item["id"] for item in self.client.get("/items").json()["items"]], [ink])
+
+
+if __name__ == "__main__":
+    unittest.main()